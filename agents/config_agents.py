@@ -11,12 +11,29 @@ def config_agent(_flags):
     flags.DEFINE_integer("max_step", 500, "Maximum time step per episode")
     flags.DEFINE_boolean("eval_on_train", True, "Evaluation for every eval_step")
     flags.DEFINE_integer("eval_step", 2500, "Number of steps before training")
+    flags.DEFINE_boolean("background_eval", False, "Evaluate on train in a separate process without pausing training")
+    flags.DEFINE_integer("n_envs", 1, "Number of environments stepped in worker processes")
+    flags.DEFINE_boolean("async_rollout", False, "Overlap env steps with inference and updates")
+    flags.DEFINE_integer("n_actors", 0, "Number of actor processes feeding a separate learner (0: off)")
+    flags.DEFINE_integer("broadcast_every", 100, "Learner updates between weight broadcasts to actors")
 
     # RL setting
     flags.DEFINE_float("df", 0.9, "Discount factor")
     flags.DEFINE_integer("b_size", 10000, "Size of the replay memory")
+    flags.DEFINE_string("replay_dir", "", "Keep the replay memory on disk in results/replay/<replay_dir>")
+    flags.DEFINE_integer("replay_hot_size", 10000, "Recent transitions of a disk replay memory also kept in RAM, 0 for none")
+    flags.DEFINE_boolean("replay_compact", False, "Store every observation once, in compact dtypes, in the replay memory")
+    flags.DEFINE_string("replay_frame_dtype", "float32", "Dtype of the states and non-binary observation features of replay_compact: float32 (no widening on sampling) or float16 (smaller)")
+    flags.DEFINE_boolean("replay_render", False, "Store world states in the replay memory and render observations on sampling")
+    flags.DEFINE_integer("replay_render_check", 1000, "Render every n-th transition of replay_render again when stored, to check it (0: first only)")
     flags.DEFINE_integer("m_size", 64, "Minibatch size")
     flags.DEFINE_integer("pre_train_step", 10, "during [m_size * pre_step] take random action")
+    flags.DEFINE_integer("train_every", 1, "Number of env steps between training calls")
+    flags.DEFINE_integer("updates_per_train", 1, "Number of minibatch updates per training call")
+    flags.DEFINE_integer("prefetch", 0, "Minibatches sampled ahead by a background thread (0: off)")
+    flags.DEFINE_boolean("per", False, "Prioritized experience replay by critic TD error")
+    flags.DEFINE_float("per_alpha", 0.6, "Priority exponent of prioritized replay")
+    flags.DEFINE_float("per_beta", 0.4, "Initial importance sampling exponent of prioritized replay")
 
     # Network training setting
     flags.DEFINE_float("a_lr", 0.00001, "Learning rate")
@@ -31,6 +48,7 @@ def config_agent(_flags):
     flags.DEFINE_boolean("load_nn", False, "Load nn from file or not")
     flags.DEFINE_string("nn_file", "", "The name of file for loading")
     flags.DEFINE_boolean("train", True, "Training or testing")
+    flags.DEFINE_integer("eval_seeds", 0, "Number of seeds tested in parallel from nn_file (0: test once)")
 
     flags.DEFINE_integer("comm", 5, "Communication type")
     flags.DEFINE_integer("capa", 2, "Capacity for comm")
@@ -45,6 +45,8 @@ class ActionSelectorNetwork:
         self.schedule_ph = tf.placeholder(dtype=tf.float32, shape=[None, self.n_agent])
         self.a_onehot = tf.reshape(tf.one_hot(self.action_ph, self.action_dim, 1.0, 0.0), [-1, action_dim * n_agent])
         self.td_errors = tf.placeholder(dtype=tf.float32, shape=[None, 1])
+        # importance sampling weights of prioritized replay
+        self.is_weights_ph = tf.placeholder_with_default(tf.ones_like(self.td_errors), shape=[None, 1])
 
         # indicators (go into target computation)
         self.is_training_ph = tf.placeholder(dtype=tf.bool, shape=()) 
@@ -58,7 +60,7 @@ class ActionSelectorNetwork:
         self.responsible = tf.multiply(self.actions, self.a_onehot)
         log_prob = tf.log(tf.reduce_sum(self.responsible, reduction_indices=1, keep_dims=True))
         entropy = -tf.reduce_sum(self.actions*tf.log(self.actions), 1)
-        self.loss = tf.reduce_sum(-(tf.multiply(log_prob, self.td_errors) + 0.01*entropy)) 
+        self.loss = tf.reduce_sum(-(tf.multiply(log_prob, self.td_errors * self.is_weights_ph) + 0.01*entropy)) 
         var_grads = tf.gradients(self.loss, self.actor_vars)
         self.actor_train_op = tf.train.AdamOptimizer(lr_actor * lr_decay).apply_gradients(zip(var_grads,self.actor_vars))
 
@@ -77,13 +79,15 @@ class ActionSelectorNetwork:
                                         self.schedule_ph: schedule_ph,
                                         self.is_training_ph: False})
 
-    def training_actor(self, state_ph, action_ph, schedule_ph, td_errors):
-        return self.sess.run(self.actor_train_op,
-                             feed_dict={self.state_ph: state_ph,
-                                        self.action_ph: action_ph,
-                                        self.schedule_ph: schedule_ph,
-                                        self.td_errors: td_errors,
-                                        self.is_training_ph: True})
+    def training_actor(self, state_ph, action_ph, schedule_ph, td_errors, is_weights=None):
+        feed_dict = {self.state_ph: state_ph,
+                     self.action_ph: action_ph,
+                     self.schedule_ph: schedule_ph,
+                     self.td_errors: td_errors,
+                     self.is_training_ph: True}
+        if is_weights is not None:
+            feed_dict[self.is_weights_ph] = np.reshape(is_weights, [-1, 1])
+        return self.sess.run(self.actor_train_op, feed_dict=feed_dict)
 
 
 class CriticNetwork:
@@ -109,6 +113,9 @@ class CriticNetwork:
         self.priority_ph = tf.placeholder(dtype=tf.float32, shape=[None, self.n_agent])
         self.next_priority_ph = tf.placeholder(dtype=tf.float32, shape=[None, self.n_agent])
 
+        # importance sampling weights of prioritized replay
+        self.is_weights_ph = tf.placeholder_with_default(tf.ones_like(self.reward_ph), shape=[None])
+
         with tf.variable_scope(scope):
             # Critic applied to state_ph
             self.q_values, self.sch_q_values = self.generate_critic_network(self.state_ph, self.priority_ph, trainable=True)
@@ -130,7 +137,7 @@ class CriticNetwork:
         sch_td_errors = sch_target - self.sch_q_values
 
         critic_vars = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope=scope)
-        critic_loss = tf.reduce_mean(tf.square(self.td_errors) + tf.square(sch_td_errors))
+        critic_loss = tf.reduce_mean(tf.expand_dims(self.is_weights_ph, 1) * (tf.square(self.td_errors) + tf.square(sch_td_errors)))
 
         # critic optimizer
         self.critic_train_op = tf.train.AdamOptimizer(lr_critic * lr_decay).minimize(critic_loss, var_list=critic_vars)
@@ -181,16 +188,18 @@ class CriticNetwork:
 
         return q_values, sch_q_values
 
-    def training_critic(self, state_ph, reward_ph, next_state_ph, priority_ph, next_priority_ph, is_not_terminal_ph):
-
-        return self.sess.run([self.td_errors, self.critic_train_op],
-                             feed_dict={self.state_ph: state_ph,
-                                        self.reward_ph: reward_ph,
-                                        self.next_state_ph: next_state_ph,
-                                        self.is_not_terminal_ph: is_not_terminal_ph,
-                                        self.priority_ph: priority_ph,
-                                        self.next_priority_ph: next_priority_ph,
-                                        self.is_training_ph: True})
+    def training_critic(self, state_ph, reward_ph, next_state_ph, priority_ph, next_priority_ph, is_not_terminal_ph, is_weights=None):
+
+        feed_dict = {self.state_ph: state_ph,
+                     self.reward_ph: reward_ph,
+                     self.next_state_ph: next_state_ph,
+                     self.is_not_terminal_ph: is_not_terminal_ph,
+                     self.priority_ph: priority_ph,
+                     self.next_priority_ph: next_priority_ph,
+                     self.is_training_ph: True}
+        if is_weights is not None:
+            feed_dict[self.is_weights_ph] = is_weights
+        return self.sess.run([self.td_errors, self.critic_train_op], feed_dict=feed_dict)
 
     def training_target_critic(self):
         return self.sess.run(self.update_slow_targets_op_c,
@@ -0,0 +1,157 @@
+from __future__ import print_function, division, absolute_import
+
+import logging
+import multiprocessing
+import time
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+import numpy as np
+import config
+
+FLAGS = config.flags.FLAGS
+logger = logging.getLogger('Agent.actor')
+
+# transitions an actor collects before sending them to the learner
+send_every = 16
+
+
+def run_actor(actor, seed, n_actors, transition_queue, weight_queue, stop, flag_values):
+    """
+    Run episodes with a local copy of the policy and send the transitions
+    to the learner, taking up new weights whenever the learner sends them
+
+    The actor estimates the global step, which drives pre-training and
+    epsilon, from the step of the last broadcast plus n_actors per local
+    step since. Episodes only end when the env is done. The local trainer
+    only acts: it has no GUI, critic or replay memory.
+
+    :param actor: index of the actor, sent along with its transitions
+    """
+
+    config.set_flag_values(flag_values)
+    import make_env
+    from agents.schednet.trainer import Trainer, epsilon_dec, epsilon_min
+
+    env_seed, trainer_seed = seed.spawn(2)
+    env = make_env.make_env(FLAGS.scenario)
+    env.seed(env_seed)
+    trainer = Trainer(env, seed=trainer_seed, learner=False)
+
+    synced_step, local_step = 0, 0
+    transitions, episodes = [], []
+
+    while not stop.is_set():
+        obs_n = env.reset()
+        info_n = env.get_info()
+        h_schedule_n = np.zeros(trainer._n_predator)
+        obs_n, state, _ = trainer.get_obs_state_with_schedule(obs_n, info_n, h_schedule_n, init=True)
+        step_in_ep, total_reward = 0, 0
+
+        while not stop.is_set():
+            # keep the newest weights sent so far
+            weights = None
+            try:
+                while True:
+                    weights, synced_step = weight_queue.get_nowait()
+                    local_step = 0
+            except queue.Empty:
+                pass
+            if weights is not None:
+                trainer._predator_agent.set_weights(weights)
+
+            local_step += 1
+            step_in_ep += 1
+            global_step = synced_step + local_step * n_actors
+            trainer.epsilon = max(0.5 - global_step * epsilon_dec, epsilon_min)
+
+            schedule_n, priority = trainer.get_schedule(obs_n, global_step, FLAGS.sched)
+            action_n = trainer.get_action(obs_n, schedule_n, global_step)
+            obs_n_without_schedule, reward_n, done_n, info_n = env.step(action_n)
+            obs_n_next, state_next, h_schedule_n = trainer.get_obs_state_with_schedule(obs_n_without_schedule, info_n, h_schedule_n, schedule_n)
+
+            done_single = sum(done_n) > 0
+            predator_idx = trainer._agent_profile['predator']['idx']
+            transitions.append((state, [obs_n[i] for i in predator_idx], [action_n[i] for i in predator_idx],
+                                np.sum([reward_n[i] for i in predator_idx]), state_next,
+                                [obs_n_next[i] for i in predator_idx], schedule_n, priority, done_single))
+
+            obs_n = obs_n_next
+            state = state_next
+            total_reward += np.sum(reward_n)
+
+            # the learner decides when training is over
+            if done_single:
+                episodes.append((step_in_ep, total_reward))
+            if done_single or len(transitions) >= send_every:
+                transition_queue.put((actor, transitions, episodes))
+                transitions, episodes = [], []
+            if done_single:
+                break
+
+
+class ActorPool(object):
+    """
+    Actor processes for a learner in this process
+
+    Actors are started with the spawn method, so that they build their own
+    TF session instead of inheriting the learner's.
+    """
+
+    def __init__(self, n_actors, seed):
+        ctx = multiprocessing.get_context('spawn')
+        self.transition_queue = ctx.Queue()
+        self.weight_queues = [ctx.Queue() for _ in range(n_actors)]
+        self.stop = ctx.Event()
+        self.processes = []
+        for actor, (actor_seed, weight_queue) in enumerate(zip(seed.spawn(n_actors), self.weight_queues)):
+            process = ctx.Process(target=run_actor,
+                                  args=(actor, actor_seed, n_actors, self.transition_queue, weight_queue, self.stop,
+                                        config.flag_values()))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+    def broadcast(self, weights, global_step):
+        for weight_queue in self.weight_queues:
+            weight_queue.put((weights, global_step))
+
+    def receive(self, block=False):
+        """
+        :param block: wait for at least one message if none is pending
+        :return: list of (actor, transitions, episodes) messages from the actors
+        """
+
+        messages = []
+        try:
+            while block and not messages:
+                try:
+                    messages.append(self.transition_queue.get(timeout=1.0))
+                except queue.Empty:
+                    if not all(process.is_alive() for process in self.processes):
+                        raise RuntimeError("An actor process exited unexpectedly")
+            while True:
+                messages.append(self.transition_queue.get_nowait())
+        except queue.Empty:
+            pass
+        return messages
+
+    def close(self, timeout=30.0):
+        """
+        Stop the actors, terminating those still running after timeout seconds
+        """
+
+        self.stop.set()
+        deadline = time.time() + timeout
+        # keep draining, actors cannot exit while their queue feeders block
+        while any(process.is_alive() for process in self.processes) and time.time() < deadline:
+            self.receive()
+            for process in self.processes:
+                process.join(timeout=0.1)
+        for process in self.processes:
+            if process.is_alive():
+                logger.warning("Terminating actor process %d, which did not stop", process.pid)
+                process.terminate()
+                process.join()
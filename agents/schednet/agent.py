@@ -1,11 +1,12 @@
 # coding=utf8
 
 from __future__ import print_function, division, absolute_import
-import random
+import threading
 import numpy as np
 import tensorflow as tf
 
-from agents.schednet.replay_buffer import ReplayBuffer
+from agents.schednet.replay_buffer import make_replay_buffer
+from agents.schednet.prefetcher import Prefetcher, sample_batches
 from agents.schednet.ac_network import ActionSelectorNetwork
 from agents.schednet.ac_network import CriticNetwork
 from agents.schednet.sched_network import WeightGeneratorNetwork
@@ -21,9 +22,23 @@ result = logging.getLogger('Result')
 
 class PredatorAgent(object):
 
-    def __init__(self, n_agent, action_dim, state_dim, obs_dim, name=""):
+    def __init__(self, n_agent, action_dim, state_dim, obs_dim, name="", seed=None, renderer=None, learner=True):
+        """
+        :param learner: False for a copy that only acts, e.g. in an actor or
+                        evaluation process: no critic and no replay memory
+        """
+
         logger.info("Predator Agent is created")
 
+        # random stream for sampling actions, exploring and scheduling, and
+        # one of its own for the replay memory, which FLAGS.prefetch samples
+        # from in another thread
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        act_seed, replay_seed = seed.spawn(2)
+        self._rng = np.random.default_rng(act_seed)
+        self._replay_rng = np.random.default_rng(replay_seed)
+
         self._n_agent = n_agent
         self._state_dim = state_dim
         self._action_dim_per_unit = action_dim
@@ -32,49 +47,90 @@ class PredatorAgent(object):
 
         self._name = name
         self.update_cnt = 0
+        self.step_cnt = 0
 
         # Make Networks
         tf.reset_default_graph()
         my_graph = tf.Graph()
 
         with my_graph.as_default():
+            # weight initialization follows the agent's random stream
+            tf.set_random_seed(int(self._rng.integers(2 ** 31)))
             self.sess = tf.Session(graph=my_graph, config=tf.ConfigProto(gpu_options=tf.GPUOptions(allow_growth=True)))
 
             self.action_selector = ActionSelectorNetwork(self.sess, self._n_agent, self._obs_dim_per_unit, self._action_dim_per_unit, self._name)
             self.weight_generator = WeightGeneratorNetwork(self.sess, self._n_agent, self._obs_dim)
-            self.critic = CriticNetwork(self.sess, self._n_agent, self._state_dim, self._name)
+            if learner:
+                self.critic = CriticNetwork(self.sess, self._n_agent, self._state_dim, self._name)
 
             self.sess.run(tf.global_variables_initializer())
             self.saver = tf.train.Saver()
 
+            # policy weights as numpy arrays, for acting copies of the agent in other processes
+            self._weights = self.action_selector.actor_vars + self.weight_generator.actor_vars
+            self._weight_phs = [tf.placeholder(v.dtype.base_dtype, v.shape) for v in self._weights]
+            self._assign_weights = tf.group(*[v.assign(ph) for v, ph in zip(self._weights, self._weight_phs)])
+
             if FLAGS.load_nn:
                 if FLAGS.nn_file == "":
                     logger.error("No file for loading Neural Network parameter")
                     exit()
                 self.saver.restore(self.sess, FLAGS.nn_file)
 
-        self.replay_buffer = ReplayBuffer()
+        self.replay_buffer = None
+        self.replay_lock = threading.Lock()  # for FLAGS.prefetch, which samples in a thread
+        self._prefetcher = None
+        if learner:
+            self.replay_buffer = make_replay_buffer(rng=self._replay_rng, renderer=renderer)
+        if learner and FLAGS.prefetch > 0:
+            self._prefetcher = Prefetcher(self.replay_buffer, self.replay_lock, FLAGS.updates_per_train,
+                                          self._obs_dim, FLAGS.prefetch)
         self._eval = Evaluation()
 
     def save_nn(self, global_step):
         self.saver.save(self.sess, config.nn_filename, global_step)
+        if self.replay_buffer is not None:
+            self.replay_buffer.flush()
+
+    def close(self):
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+
+    def restore_nn(self, filename):
+        self.saver.restore(self.sess, filename)
+
+    def get_weights(self):
+        return self.sess.run(self._weights)
+
+    def set_weights(self, weights):
+        self.sess.run(self._assign_weights, feed_dict=dict(zip(self._weight_phs, weights)))
 
     def act(self, obs_list, schedule_list):
 
-        action_prob_list = self.action_selector.action_for_state(np.concatenate(obs_list)
-                                                                   .reshape(1, self._obs_dim),
-                                                                 schedule_list.reshape(1, self._n_agent))
+        return self.act_batch(np.concatenate(obs_list).reshape(1, self._obs_dim),
+                              schedule_list.reshape(1, self._n_agent))[0].tolist()
+
+    def act_batch(self, obs, schedule):
+        """
+        Actions for a batch of joint observations, with one sess.run
+
+        :param obs: (batch, obs_dim) joint observations
+        :param schedule: (batch, n_agent) schedules
+        :return: (batch, n_agent) array of actions
+        """
+
+        action_prob_list = self.action_selector.action_for_state(obs, schedule)
 
         if np.isnan(action_prob_list).any():
             raise ValueError('action_prob contains NaN')
 
-        action_list = []
-        for action_prob in action_prob_list.reshape(self._n_agent, self._action_dim_per_unit):
-            action_list.append(np.random.choice(len(action_prob), p=action_prob))
-
-        return action_list
+        # sample the actions of all agents at once by inverting their CDFs
+        cdf = np.cumsum(action_prob_list.reshape(-1, self._n_agent, self._action_dim_per_unit), axis=2)
+        u = self._rng.random(cdf.shape[:2] + (1,)) * cdf[:, :, -1:]
+        return np.minimum((cdf <= u).sum(axis=2), self._action_dim_per_unit - 1)
 
-    def train(self, state, obs_list, action_list, reward_list, state_next, obs_next_list, schedule_n, priority, done):
+    def train(self, state, obs_list, action_list, reward_list, state_next, obs_next_list, schedule_n, priority, done,
+              source=0):
 
         s = state
         o = obs_list
@@ -85,56 +141,79 @@ class PredatorAgent(object):
         c = schedule_n
         p = priority
 
-        self.store_sample(s, o, a, r, s_, o_, c, p, done)
-        self.update_ac()
+        self.store_sample(s, o, a, r, s_, o_, c, p, done, source)
+        self.step_cnt += 1
+        if self.step_cnt % FLAGS.train_every == 0:
+            self.update_ac()
         return 0
 
-    def store_sample(self, s, o, a, r, s_, o_, c, p, done):
+    def store_sample(self, s, o, a, r, s_, o_, c, p, done, source=0):
+        # source: the env or actor the transition comes from
 
-        self.replay_buffer.add_to_memory((s, o, a, r, s_, o_, c, p, done))
+        with self.replay_lock:
+            self.replay_buffer.add_to_memory((s, o, a, r, s_, o_, c, p, done), source)
         return 0
 
     def update_ac(self):
         
-        if len(self.replay_buffer.replay_memory) < FLAGS.pre_train_step * FLAGS.m_size:
+        if len(self.replay_buffer) < FLAGS.pre_train_step * FLAGS.m_size:
             return 0
 
-        minibatch = self.replay_buffer.sample_from_memory()
-        s, o, a, r, s_, o_, c, p, d = map(np.array, zip(*minibatch))
-        o = np.reshape(o, [-1, self._obs_dim])
-        o_ = np.reshape(o_, [-1, self._obs_dim])
+        # one draw for all the updates of this call, unless prefetched
+        n_updates = FLAGS.updates_per_train
+        if self._prefetcher is not None:
+            batches = [self._prefetcher.get() for _ in range(n_updates)]
+        else:
+            batches = sample_batches(self.replay_buffer, self.replay_lock, n_updates, self._obs_dim)
 
-        p_ = self.weight_generator.target_schedule_for_obs(o_)
-        
-        td_error, _ = self.critic.training_critic(s, r, s_, p, p_, d)  # train critic
-        _ = self.action_selector.training_actor(o, a, c, td_error)  # train actor
+        for s, o, a, r, s_, o_, c, p, d, rows, versions, is_weights in batches:
+            p_ = self.weight_generator.target_schedule_for_obs(o_)
 
-        wg_grads = self.critic.grads_for_scheduler(s, p)
-        _ = self.weight_generator.training_weight_generator(o, wg_grads)
-        _ = self.critic.training_target_critic()  # train slow target critic
-        _ = self.weight_generator.training_target_weight_generator()
+            td_error, _ = self.critic.training_critic(s, r, s_, p, p_, d, is_weights)  # train critic
+            _ = self.action_selector.training_actor(o, a, c, td_error, is_weights)  # train actor
+            if FLAGS.per:
+                with self.replay_lock:
+                    self.replay_buffer.update_priorities(rows, td_error[:, 0], versions)
+
+            wg_grads = self.critic.grads_for_scheduler(s, p)
+            _ = self.weight_generator.training_weight_generator(o, wg_grads)
+            _ = self.critic.training_target_critic()  # train slow target critic
+            _ = self.weight_generator.training_target_weight_generator()
+            self.update_cnt += 1
 
         return 0
 
     def schedule(self, obs_list):
-        priority = self.weight_generator.schedule_for_obs(np.concatenate(obs_list)
-                                                           .reshape(1, self._obs_dim))
+        ret, priority = self.schedule_batch(np.concatenate(obs_list).reshape(1, self._obs_dim))
+        return ret[0], priority[0]
+
+    def schedule_batch(self, obs):
+        """
+        Schedules for a batch of joint observations, with one sess.run
+
+        :param obs: (batch, obs_dim) joint observations
+        :return: (batch, n_agent) schedules and priorities
+        """
+
+        priority = self.weight_generator.schedules_for_obs(obs)
+        rows = np.arange(len(priority)).reshape(-1, 1)
 
         if FLAGS.sch_type == "top":
-            schedule_idx = np.argsort(-priority)[:FLAGS.s_num]
+            schedule_idx = np.argsort(-priority, axis=1)[:, :FLAGS.s_num]
         elif FLAGS.sch_type == "softmax":
-            sm = softmax(priority)
-            schedule_idx = np.random.choice(self._n_agent, p=sm)
+            schedule_idx = [self._rng.choice(self._n_agent, p=softmax(p)) for p in priority]
         else: # IF N_SUM == 1
-            schedule_idx = np.argmax(priority)
-                            
-        ret = np.zeros(self._n_agent)
-        ret[schedule_idx] = 1.0
+            schedule_idx = np.argmax(priority, axis=1)
+
+        ret = np.zeros((len(priority), self._n_agent))
+        ret[rows, np.reshape(schedule_idx, (len(priority), -1))] = 1.0
         return ret, priority
 
     def explore(self):
-        return [random.randrange(self._action_dim_per_unit)
-                for _ in range(self._n_agent)]
+        return self.explore_batch(1)[0].tolist()
+
+    def explore_batch(self, batch):
+        return self._rng.integers(self._action_dim_per_unit, size=(batch, self._n_agent))
 
 
 def softmax(x):
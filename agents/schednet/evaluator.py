@@ -0,0 +1,165 @@
+from __future__ import print_function, division, absolute_import
+
+import multiprocessing
+import traceback
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+import config
+
+FLAGS = config.flags.FLAGS
+
+
+# 0.975 quantiles of Student's t for 1 to 30 degrees of freedom
+T_975 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+         2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+         2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def t_quantile_975(df):
+    """
+    0.975 quantile of Student's t with df degrees of freedom, the factor of
+    a two-sided 95% confidence interval of a mean; from T_975 up to 30, and
+    beyond from the Cornish-Fisher expansion around the normal quantile
+    """
+
+    if df <= len(T_975):
+        return T_975[df - 1]
+    z = 1.959964
+    return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+
+
+def run_test(args):
+    """
+    Play Trainer.run_test() with the network in nn_file, in a fresh env
+    and acting-only trainer seeded from seed
+
+    :return: average steps to capture and None, or None and the traceback
+             of the error, which may not survive pickling itself
+    """
+
+    nn_file, seed = args
+
+    try:
+        import make_env
+        from agents.schednet.trainer import Trainer
+
+        env_seed, trainer_seed = seed.spawn(2)
+        env = make_env.make_env(FLAGS.scenario)
+        env.seed(env_seed)
+        trainer = Trainer(env, seed=trainer_seed, learner=False)
+        trainer._predator_agent.restore_nn(nn_file)
+
+        global_step, episode_num, _, _ = trainer.run_test()
+        return float(global_step) / episode_num, None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def evaluate(nn_file, seeds):
+    """
+    run_test() for every seed, each in its own worker process
+
+    Workers are started with the spawn method, so that each builds its own
+    TF session, and take the parsed flags of this process.
+
+    :param seeds: list of SeedSequence
+    :return: list of average steps to capture, in the order of seeds
+    """
+
+    ctx = multiprocessing.get_context('spawn')
+    pool = ctx.Pool(len(seeds), initializer=config.set_flag_values, initargs=(config.flag_values(),))
+    try:
+        results = pool.map(run_test, [(nn_file, seed) for seed in seeds])
+    finally:
+        pool.close()
+        pool.join()
+
+    for _, error in results:
+        if error is not None:
+            raise RuntimeError("An evaluation process failed:\n" + error)
+    return [steps for steps, _ in results]
+
+
+def run_background_test(seed, task_queue, result_queue, flag_values):
+    """
+    Test the weight snapshots of task_queue until None is received, putting
+    (step, Trainer.run_test() result) of each on result_queue
+
+    The worker takes the parsed flags of the learner and plays with an
+    acting-only trainer.
+    """
+
+    config.set_flag_values(flag_values)
+    import make_env
+    from agents.schednet.trainer import Trainer
+
+    env_seed, trainer_seed = seed.spawn(2)
+    env = make_env.make_env(FLAGS.scenario)
+    env.seed(env_seed)
+    trainer = Trainer(env, seed=trainer_seed, learner=False)
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        weights, step = task
+        trainer._predator_agent.set_weights(weights)
+        result_queue.put((step, trainer.run_test()))
+
+
+class BackgroundEvaluator(object):
+    """
+    Test weight snapshots in a worker process while training goes on
+
+    The worker keeps its own env and network, so snapshots queue up instead
+    of pausing the learner; results come back tagged with the step of their
+    snapshot.
+    """
+
+    def __init__(self, seed):
+        ctx = multiprocessing.get_context('spawn')
+        self.task_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+        self.pending = 0
+        self.process = ctx.Process(target=run_background_test,
+                                   args=(seed, self.task_queue, self.result_queue, config.flag_values()))
+        self.process.daemon = True
+        self.process.start()
+
+    def submit(self, weights, step):
+        self.task_queue.put((weights, step))
+        self.pending += 1
+
+    def poll(self, block=False):
+        """
+        :param block: wait for the results of all submitted snapshots
+        :return: list of (step, Trainer.run_test() result) finished so far
+        """
+
+        results = []
+        while self.pending > 0:
+            try:
+                if block:
+                    results.append(self.result_queue.get(timeout=1.0))
+                else:
+                    results.append(self.result_queue.get_nowait())
+                self.pending -= 1
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError("The evaluation process exited unexpectedly")
+                if not block:
+                    break
+        return results
+
+    def close(self):
+        """
+        :return: results of the snapshots still pending
+        """
+
+        results = self.poll(block=True)
+        self.task_queue.put(None)
+        self.process.join()
+        return results
@@ -0,0 +1,110 @@
+from __future__ import print_function, division, absolute_import
+
+import logging
+import threading
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+import numpy as np
+import config
+
+FLAGS = config.flags.FLAGS
+logger = logging.getLogger('Agent.prefetch')
+
+
+def sample_batches(replay_buffer, lock, n_batches, obs_dim):
+    """
+    Draw n_batches minibatches from replay_buffer at once, in the dtypes and
+    shapes the networks are fed with
+
+    :param lock: held while sampling, against concurrent writes to the memory
+    :param obs_dim: joint observation size, o and o_ become (m_size, obs_dim)
+    :return: list of (s, o, a, r, s_, o_, c, p, done, rows, versions,
+             is_weights) per minibatch, the rows with their row_versions()
+             and the weights being None without FLAGS.per
+    """
+
+    with lock:
+        if FLAGS.per:
+            minibatch, rows, is_weights = replay_buffer.sample_prioritized(n_batches)
+            versions = replay_buffer.row_versions(rows)
+        else:
+            minibatch = replay_buffer.sample_from_memory(n_batches)
+
+    if FLAGS.per:
+        rows = rows.reshape(n_batches, -1)
+        versions = versions.reshape(n_batches, -1)
+        is_weights = is_weights.astype(np.float32).reshape(n_batches, -1)
+    else:
+        rows = versions = is_weights = [None] * n_batches
+    s, o, a, r, s_, o_, c, p, done = minibatch
+    s, s_, c, p = [np.asarray(x, dtype=np.float32).reshape((n_batches, -1) + x.shape[1:]) for x in (s, s_, c, p)]
+    o, o_ = [np.asarray(x, dtype=np.float32).reshape(n_batches, -1, obs_dim) for x in (o, o_)]
+    a = np.asarray(a, dtype=np.int32).reshape((n_batches, -1) + a.shape[1:])
+    r, done = [np.asarray(x, dtype=np.float32).reshape(n_batches, -1) for x in (r, done)]
+    return list(zip(s, o, a, r, s_, o_, c, p, done, rows, versions, is_weights))
+
+
+class Prefetcher(object):
+    """
+    Thread keeping a bounded queue of sample_batches() minibatches, so that
+    sampling and conversion overlap the updates of the learner
+
+    TF releases the GIL in sess.run, which is where the thread gets to run.
+    Every other access to the replay memory has to hold lock. Minibatches
+    are up to depth updates behind the memory, and which transitions they
+    see depends on thread timing, so runs are no longer reproducible from
+    the seed. With FLAGS.per, priorities go only to the sampled rows not
+    rewritten since, by their row versions.
+    """
+
+    def __init__(self, replay_buffer, lock, n_batches, obs_dim, depth):
+        """
+        :param n_batches: minibatches drawn at once, e.g. the updates per training call
+        :param depth: minibatches kept ready
+        """
+
+        self.replay_buffer = replay_buffer
+        self.lock = lock
+        self.n_batches = n_batches
+        self.obs_dim = obs_dim
+        self.batches = queue.Queue(max(depth, n_batches))
+        self.stop = threading.Event()
+        self.thread = None
+
+    def _run(self):
+        try:
+            while not self.stop.is_set():
+                for batch in sample_batches(self.replay_buffer, self.lock, self.n_batches, self.obs_dim):
+                    while not self.stop.is_set():
+                        try:
+                            self.batches.put(batch, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+        except Exception:
+            logger.exception("Prefetching minibatches failed")
+
+    def get(self):
+        """
+        :return: the next minibatch, starting the thread on the first call
+        """
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='prefetcher')
+            self.thread.daemon = True
+            self.thread.start()
+
+        while True:
+            try:
+                return self.batches.get(timeout=1.0)
+            except queue.Empty:
+                if not self.thread.is_alive():
+                    raise RuntimeError("The prefetch thread exited unexpectedly")
+
+    def close(self):
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -1,27 +1,583 @@
 #!/usr/bin/env python
 # coding=utf8
 import logging
+import os
 import config
-from collections import deque
-import random
+import numpy as np
 
 FLAGS = config.flags.FLAGS
 
 logger = logging.getLogger('Agent.replay')
 result = logging.getLogger('Result')
 
+# names of the transition fields, as in PredatorAgent.store_sample()
+FIELDS = ['s', 'o', 'a', 'r', 's_', 'o_', 'c', 'p', 'done']
 
-class ReplayBuffer:
-    def __init__(self):
+
+def make_replay_buffer(rng=None, renderer=None):
+    # replay memory selected by FLAGS.per, FLAGS.replay_dir, FLAGS.replay_compact
+    # and FLAGS.replay_render, the latter rendering observations with renderer,
+    # the env, which also tells replay_compact the binary observation features
+    if FLAGS.replay_render:
+        if FLAGS.replay_compact or FLAGS.replay_dir:
+            raise ValueError("replay_render does not support replay_compact or replay_dir")
+        if renderer is None:
+            raise ValueError("replay_render needs an env to render observations")
+        if FLAGS.per:
+            return PrioritizedRenderReplayBuffer(rng=rng, renderer=renderer)
+        return RenderReplayBuffer(rng=rng, renderer=renderer)
+    if FLAGS.replay_compact:
+        if FLAGS.replay_dir:
+            raise ValueError("replay_compact does not support replay_dir")
+        if FLAGS.per:
+            return PrioritizedCompactReplayBuffer(rng=rng, env=renderer)
+        return CompactReplayBuffer(rng=rng, env=renderer)
+    if FLAGS.replay_dir:
+        if FLAGS.per:
+            return PrioritizedMemmapReplayBuffer(rng=rng)
+        return MemmapReplayBuffer(rng=rng)
+    if FLAGS.per:
+        return PrioritizedReplayBuffer(rng=rng)
+    return ReplayBuffer(rng=rng)
+
+
+class ReplayBuffer(object):
+    """
+    Circular replay memory of (s, o, a, r, s_, o_, c, p, done) transitions
+
+    Every field is kept in its own array of capacity rows, allocated with
+    the shape and dtype of the first transition added. Minibatches are one
+    fancy-index gather per field.
+    """
+
+    def __init__(self, rng=None):
         self.replay_memory_capacity = FLAGS.b_size  # capacity of experience replay memory
         self.minibatch_size = FLAGS.m_size  # size of minibatch from experience replay memory for updates
-        self.replay_memory = deque(maxlen=self.replay_memory_capacity)
+        self.replay_memory = None  # list of field arrays
+        self._rng = np.random.default_rng(rng)
+        self._next = 0  # row of the next transition
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add_to_memory(self, experience, source=0):
+        # source: the env or actor of the transition, whose consecutive
+        # transitions CompactReplayBuffer links
+        if self.replay_memory is None:
+            self._allocate(experience)
+        self._write(self._next, experience)
+        self._next = (self._next + 1) % self.replay_memory_capacity
+        self._size = min(self._size + 1, self.replay_memory_capacity)
+
+    def _allocate(self, experience):
+        self.replay_memory = [np.zeros((self.replay_memory_capacity,) + np.shape(x), dtype=np.asarray(x).dtype)
+                              for x in experience]
+
+    def _write(self, row, experience):
+        for field, x in zip(self.replay_memory, experience):
+            field[row] = x
+
+    def _gather(self, rows):
+        return [field[rows] for field in self.replay_memory]
+
+    def sample_from_memory(self, n_batches=1):
+        """
+        :return: list of field arrays of n_batches minibatches back to back,
+                 distinct samples while the memory allows it
+        """
+
+        n = self.minibatch_size * n_batches
+        idx = self._rng.choice(self._size, n, replace=n > self._size)
+        # rows in age order start at the oldest transition
+        idx = (self._next - self._size + idx) % self.replay_memory_capacity
+        return self._gather(idx)
+
+    def erase(self):
+        # drop the oldest transition
+        self._size = max(self._size - 1, 0)
+
+    def flush(self):
+        pass
+
+
+class SumTree(object):
+    """
+    Binary tree of sums over capacity leaf values, stored as an array with
+    the root at 1 and the leaves at n_leaf..2*n_leaf-1
+
+    Updates and lookups work on arrays of leaves, one tree level at a time.
+    """
+
+    def __init__(self, capacity):
+        self._n_leaf = 1
+        while self._n_leaf < capacity:
+            self._n_leaf *= 2
+        self._tree = np.zeros(2 * self._n_leaf)
+
+    def total(self):
+        return self._tree[1]
+
+    def get(self, idx):
+        return self._tree[np.asarray(idx) + self._n_leaf]
+
+    def update(self, idx, value):
+        node = np.asarray(idx) + self._n_leaf
+        self._tree[node] = value
+        while self._n_leaf > 1:
+            node = np.unique(node // 2)
+            self._tree[node] = self._tree[2 * node] + self._tree[2 * node + 1]
+            if node[0] == 1:
+                break
+
+    def find(self, value):
+        """
+        :param value: array of values in [0, total())
+        :return: leaves whose prefix sum interval contains each value
+        """
+
+        node = np.ones(len(value), dtype=np.int64)
+        value = np.array(value, dtype=np.float64)
+        while node[0] < self._n_leaf:
+            left = 2 * node
+            # never step into an empty subtree on rounding errors
+            right = (value >= self._tree[left]) & (self._tree[left + 1] > 0)
+            value = np.where(right, value - self._tree[left], value)
+            node = np.where(right, left + 1, left)
+        return node - self._n_leaf
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer sampling transitions in proportion to priority^alpha,
+    with priorities from the TD errors of their last update
+
+    New transitions get the largest priority seen so far. Importance
+    sampling weights correct for the non-uniform sampling, with beta
+    annealed from FLAGS.per_beta to 1 over FLAGS.training_step additions.
+
+    Each row has a version, bumped whenever the row is written or erased,
+    so that priorities from a minibatch sampled earlier, e.g. by a
+    prefetcher, are not given to the transitions that replaced it.
+    """
+
+    def __init__(self, rng=None):
+        super(PrioritizedReplayBuffer, self).__init__(rng)
+        self.alpha = FLAGS.per_alpha
+        self.eps = 1e-6  # keeps zero TD error transitions reachable
+        self._tree = SumTree(self.replay_memory_capacity)
+        self._max_priority = 1.0
+        self._n_added = 0
+        self._row_version = np.zeros(self.replay_memory_capacity, dtype=np.int64)
+        if self._size > 0:
+            # transitions of a reopened memory start out equally likely
+            rows = (self._next - self._size + np.arange(self._size)) % self.replay_memory_capacity
+            self._tree.update(rows, self._max_priority ** self.alpha)
+
+    def add_to_memory(self, experience, source=0):
+        row = self._next
+        super(PrioritizedReplayBuffer, self).add_to_memory(experience, source)
+        self._tree.update([row], self._max_priority ** self.alpha)
+        self._row_version[row] += 1
+        self._n_added += 1
+
+    def sample_prioritized(self, n_batches=1):
+        """
+        :return: list of field arrays of n_batches minibatches back to back,
+                 their rows for update_priorities(), and their importance
+                 sampling weights
+        """
+
+        n = self.minibatch_size * n_batches
+        # one value per equal slice of the total priority, in random order
+        segment = self._tree.total() / n
+        value = (np.arange(n) + self._rng.random(n)) * segment
+        rows = self._tree.find(self._rng.permutation(value))
+
+        beta = FLAGS.per_beta + (1.0 - FLAGS.per_beta) * min(1.0, self._n_added / FLAGS.training_step)
+        prob = self._tree.get(rows) / self._tree.total()
+        weights = (self._size * prob) ** -beta
+        weights /= weights.max()
+        return self._gather(rows), rows, weights
+
+    def row_versions(self, rows):
+        return self._row_version[rows]
+
+    def update_priorities(self, rows, td_errors, versions=None):
+        """
+        :param versions: row_versions() of rows when they were sampled, to
+                         skip the rows written or erased since
+        """
+
+        if versions is not None:
+            keep = self._row_version[rows] == versions
+            rows, td_errors = rows[keep], td_errors[keep]
+            if len(rows) == 0:
+                return
+        priority = np.abs(td_errors) + self.eps
+        self._max_priority = max(self._max_priority, priority.max())
+        self._tree.update(rows, priority ** self.alpha)
+
+    def erase(self):
+        if self._size > 0:
+            row = (self._next - self._size) % self.replay_memory_capacity
+            self._tree.update([row], 0.0)
+            self._row_version[row] += 1
+        super(PrioritizedReplayBuffer, self).erase()
+
+
+class MemmapReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer with its fields in .npy files under
+    ./results/replay/FLAGS.replay_dir, opened as memory maps
+
+    The capacity is bounded by disk instead of RAM. The most recent
+    transitions are also kept in a small in-RAM ring, so samples among
+    them skip the disk, unless FLAGS.replay_hot_size is 0. An existing
+    memory in the directory is reopened with its transitions, and has to
+    match the shapes and dtypes of the first transition added; flush()
+    makes it durable, e.g. at checkpoints.
+    """
+
+    def __init__(self, rng=None):
+        super(MemmapReplayBuffer, self).__init__(rng)
+        self.directory = os.path.join("./results/replay", FLAGS.replay_dir)
+        if FLAGS.replay_hot_size < 0:
+            raise ValueError("replay_hot_size has to be 0 or more, not %d" % FLAGS.replay_hot_size)
+        self.hot_size = min(FLAGS.replay_hot_size, self.replay_memory_capacity)
+        self._hot = None
+        self._hot_next = 0  # slot of the next transition in the RAM ring
+        self._n_hot = 0
+        self._meta = None  # memmap of (next row, size)
+        self._reopened = False  # fields not yet checked against a transition
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        if os.path.exists(self._path('meta')):
+            self._reopen()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + '.npy')
 
-    def add_to_memory(self, experience):
-        self.replay_memory.append(experience)
+    def _reopen(self):
+        self._meta = np.load(self._path('meta'), mmap_mode='r+')
+        self.replay_memory = [np.load(self._path(name), mmap_mode='r+') for name in FIELDS]
+        if len(self.replay_memory[0]) != self.replay_memory_capacity:
+            raise ValueError("Replay memory in %s holds %d transitions, not b_size %d"
+                             % (self.directory, len(self.replay_memory[0]), self.replay_memory_capacity))
+        self._next, self._size = int(self._meta[0]), int(self._meta[1])
+        self._reopened = True
+        self._allocate_hot()
+        logger.info("Reopened replay memory %s with %d transitions", self.directory, self._size)
 
-    def sample_from_memory(self):
-        return random.sample(self.replay_memory, self.minibatch_size)
+    def _allocate(self, experience):
+        self.replay_memory = [np.lib.format.open_memmap(self._path(name), mode='w+', dtype=np.asarray(x).dtype,
+                                                        shape=(self.replay_memory_capacity,) + np.shape(x))
+                              for name, x in zip(FIELDS, experience)]
+        self._meta = np.lib.format.open_memmap(self._path('meta'), mode='w+', dtype=np.int64, shape=(2,))
+        self._allocate_hot()
+
+    def _allocate_hot(self):
+        self._hot = [np.zeros((self.hot_size,) + field.shape[1:], dtype=field.dtype) for field in self.replay_memory]
+
+    def _check_fields(self, experience):
+        # a reopened memory has to hold transitions like the ones added now
+        for name, field, x in zip(FIELDS, self.replay_memory, experience):
+            x = np.asarray(x)
+            if field.shape[1:] != x.shape or field.dtype != x.dtype:
+                raise ValueError("Replay memory in %s holds %s of shape %s and dtype %s, not %s and %s"
+                                 % (self.directory, name, field.shape[1:], field.dtype, x.shape, x.dtype))
+        self._reopened = False
+
+    def _write(self, row, experience):
+        for field, x in zip(self.replay_memory, experience):
+            field[row] = x
+        if self.hot_size == 0:
+            return
+        for hot, x in zip(self._hot, experience):
+            hot[self._hot_next] = x
+        self._hot_next = (self._hot_next + 1) % self.hot_size
+        self._n_hot = min(self._n_hot + 1, self.hot_size)
+
+    def add_to_memory(self, experience, source=0):
+        if self._reopened:
+            self._check_fields(experience)
+        super(MemmapReplayBuffer, self).add_to_memory(experience, source)
+        self._meta[:] = self._next, self._size
+
+    def _gather(self, rows):
+        if self._n_hot == 0:
+            return super(MemmapReplayBuffer, self)._gather(rows)
+        age = (self._next - 1 - rows) % self.replay_memory_capacity
+        hot = age < self._n_hot
+        slots = (self._hot_next - 1 - age[hot]) % self.hot_size
+        cold = rows[~hot]
+
+        ret = []
+        for field, hot_field in zip(self.replay_memory, self._hot):
+            x = np.empty((len(rows),) + field.shape[1:], dtype=field.dtype)
+            x[hot] = hot_field[slots]
+            x[~hot] = field[cold]
+            ret.append(x)
+        return ret
 
     def erase(self):
-        self.replay_memory.popleft()
+        super(MemmapReplayBuffer, self).erase()
+        self._n_hot = min(self._n_hot, self._size)
+        if self._meta is not None:
+            self._meta[:] = self._next, self._size
+
+    def flush(self):
+        if self._meta is None:
+            return
+        for field in self.replay_memory:
+            field.flush()
+        self._meta.flush()
+
+
+class PrioritizedMemmapReplayBuffer(PrioritizedReplayBuffer, MemmapReplayBuffer):
+    """
+    PrioritizedReplayBuffer over MemmapReplayBuffer storage; priorities
+    live in RAM only and start equal again when the memory is reopened
+    """
+
+
+def feature_columns(mask):
+    # indices of the features in mask, as a slice when they are contiguous
+    idx = np.flatnonzero(mask)
+    if len(idx) == 0:
+        return slice(0, 0)
+    if idx[-1] - idx[0] + 1 == len(idx):
+        return slice(idx[0], idx[-1] + 1)
+    return idx
+
+
+class CompactReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer keeping one (s, o) frame per transition, in compact dtypes
+
+    Within an episode the (s_, o_) of a transition is the (s, o) of the
+    next transition from its source, the env or actor given to
+    add_to_memory(), so a transition only points at the row of that one.
+    The (s_, o_) of a transition not continued, being done or cut off,
+    e.g. at max_step, is kept in a separate store of frames. Transitions
+    wait there until their source adds the next one, and are continued
+    if it starts from their (s_, o_). The store grows to the done
+    transitions in memory plus the open episodes, and never beyond
+    b_size. Observation features that env.observation_binary() marks as
+    always 0 or 1 are kept in uint8, the others and s in
+    FLAGS.replay_frame_dtype: float16 for the smallest memory, float32 to
+    sample without widening them. Actions, rewards, schedules and
+    priorities are narrowed too.
+    """
+
+    # dtypes of the non-frame fields
+    dtypes = {'a': np.int8, 'r': np.float32, 'c': np.float16, 'p': np.float32, 'done': np.bool_}
+
+    def __init__(self, rng=None, env=None):
+        """
+        :param env: tells which observation features are binary, all are
+                    kept as floats without it
+        """
+
+        super(CompactReplayBuffer, self).__init__(rng)
+        self.frame_dtype = np.dtype(FLAGS.replay_frame_dtype)
+        if self.frame_dtype not in (np.float16, np.float32):
+            raise ValueError("replay_frame_dtype has to be float16 or float32, not %s" % FLAGS.replay_frame_dtype)
+        self._binary = None if env is None else env.observation_binary()
+        self._frames = None  # s with the float o features, and the binary ones, of each row
+        self._ends = None  # the same for the (s_, o_) not (yet) continued
+        self._free_ends = []  # unused rows of _ends
+        self._open = {}  # source -> (row, transition number) of its open episode
+        self._source = 0  # source of the transition being added
+        self._n_written = 0
+
+    def _allocate(self, experience):
+        s, o, a, r, s_, o_, c, p, done = experience
+        o = np.asarray(o)
+        binary = np.zeros(o.shape[-1], dtype=bool)
+        if self._binary is not None:
+            if len(self._binary) > len(binary):
+                raise ValueError("observation_binary() has %d features, observations only %d"
+                                 % (len(self._binary), len(binary)))
+            binary[:len(self._binary)] = self._binary
+        self._s_shape, self._o_shape = np.shape(s), o.shape
+        self._n_s = int(np.prod(self._s_shape))
+        self._bits, self._floats = feature_columns(binary), feature_columns(~binary)
+        n_floats = self._n_s + int(np.prod(o.shape[:-1])) * int((~binary).sum())
+        n_bits = o.shape[:-1] + (int(binary.sum()),)
+        self._frames = [np.zeros((self.replay_memory_capacity, n_floats), dtype=self.frame_dtype),
+                        np.zeros((self.replay_memory_capacity,) + n_bits, dtype=np.uint8)]
+        self._ends = [np.zeros((0,) + x.shape[1:], dtype=x.dtype) for x in self._frames]
+        self.replay_memory = {name: np.zeros((self.replay_memory_capacity,) + np.shape(x), dtype=self.dtypes[name])
+                              for name, x in [('a', a), ('r', r), ('c', c), ('p', p), ('done', done)]}
+        # row of the next frame in _frames, or -1 - row in _ends
+        self.replay_memory['next'] = np.zeros(self.replay_memory_capacity, dtype=np.int32)
+
+    def _frame(self, s, o):
+        o = np.asarray(o)
+        return [np.concatenate([np.ravel(s), o[..., self._floats].ravel()]).astype(self.frame_dtype),
+                o[..., self._bits].astype(np.uint8)]
+
+    def _new_end(self):
+        if not self._free_ends:
+            # double the store, which holds at most one frame per row
+            n = len(self._ends[0])
+            grown = min(max(2 * n, 64), self.replay_memory_capacity)
+            self._ends = [np.concatenate([x, np.zeros((grown - n,) + x.shape[1:], dtype=x.dtype)])
+                          for x in self._ends]
+            self._free_ends = list(range(grown - 1, n - 1, -1))
+        return self._free_ends.pop()
+
+    def add_to_memory(self, experience, source=0):
+        self._source = source
+        super(CompactReplayBuffer, self).add_to_memory(experience, source)
+
+    def _write(self, row, experience):
+        s, o, a, r, s_, o_, c, p, done = experience
+        fields = self.replay_memory
+        frame = self._frame(s, o)
+
+        # the transition written before into row leaves the memory
+        if self._n_written >= self.replay_memory_capacity and fields['next'][row] < 0:
+            self._free_ends.append(-1 - fields['next'][row])
+
+        # continue the open episode of the source if this starts where it
+        # stopped, and it is still in memory
+        prev = self._open.pop(self._source, None)
+        if prev is not None and self._n_written - prev[1] < min(self._size + 1, self.replay_memory_capacity):
+            end = -1 - fields['next'][prev[0]]
+            if all(np.array_equal(field[end], x) for field, x in zip(self._ends, frame)):
+                fields['next'][prev[0]] = row
+                self._free_ends.append(end)
+
+        for field, x in zip(self._frames, frame):
+            field[row] = x
+        end = self._new_end()
+        for field, x in zip(self._ends, self._frame(s_, o_)):
+            field[end] = x
+        fields['a'][row], fields['r'][row], fields['c'][row], fields['p'][row], fields['done'][row] = a, r, c, p, done
+        fields['next'][row] = -1 - end
+        if not done:
+            self._open[self._source] = (row, self._n_written)
+        self._n_written += 1
+
+    def _gather(self, rows):
+        fields = self.replay_memory
+        n = len(rows)
+        nxt = fields['next'][rows]
+        # frames of the transitions and of the ones continuing them, then
+        # the few (s_, o_) of transitions not continued from _ends
+        frame_rows = np.concatenate([rows, nxt])
+        ended = nxt < 0
+        frame_rows[n:][ended] = 0
+        floats, bits = [x[frame_rows] for x in self._frames]
+        if ended.any():
+            ends = np.flatnonzero(ended)
+            for x, end in zip((floats, bits), self._ends):
+                x[n + ends] = end[-1 - nxt[ends]]
+
+        # float32 frames and fields need no widening
+        floats = np.asarray(floats, dtype=np.float32)
+        s = floats[:, :self._n_s].reshape((2 * n,) + self._s_shape)
+        o = np.empty((2 * n,) + self._o_shape, dtype=np.float32)
+        o[..., self._bits] = bits
+        o[..., self._floats] = floats[:, self._n_s:].reshape((2 * n,) + self._o_shape[:-1] + (-1,))
+        return [s[:n], o[:n], fields['a'][rows].astype(np.int32), fields['r'][rows], s[n:], o[n:],
+                np.asarray(fields['c'][rows], dtype=np.float32), fields['p'][rows], fields['done'][rows]]
+
+    def nbytes(self):
+        # memory held by the transitions and frames
+        if self._frames is None:
+            return 0
+        return sum(x.nbytes for x in self._frames + self._ends) + \
+            sum(x.nbytes for x in self.replay_memory.values())
+
+
+class PrioritizedCompactReplayBuffer(PrioritizedReplayBuffer, CompactReplayBuffer):
+    """
+    PrioritizedReplayBuffer over CompactReplayBuffer storage
+    """
+
+    def __init__(self, rng=None, env=None):
+        super(PrioritizedCompactReplayBuffer, self).__init__(rng)
+        self._binary = None if env is None else env.observation_binary()
+
+
+class RenderReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer keeping the world state of each transition instead of its
+    observations, which are rendered again for every minibatch
+
+    Agent positions are read back from the coordinate state s, and the
+    only other state behind a predator observation is the prey memory it
+    carries, so a transition holds the positions before and after, the
+    predator memory and the schedule history. The renderer, an env like
+    the one the transitions come from, renders a whole minibatch with
+    MultiAgentEnv.observation_batch().
+
+    Observations that depend on anything else would silently come back
+    wrong, so the first transition and then every
+    FLAGS.replay_render_check-th one is rendered again when stored and
+    compared with its observations. Scenarios without observation_batch()
+    are refused.
+    """
+
+    def __init__(self, rng=None, renderer=None):
+        super(RenderReplayBuffer, self).__init__(rng)
+        self.renderer = renderer
+        self._scale = None  # grid width and height, state coordinates to cells
+        self._n_written = 0
+
+    def _split(self, experience):
+        # (pos, memory, h, a, r, pos_, h_, c, p, done) of a transition
+        s, o, a, r, s_, o_, c, p, done = experience
+        n = 2 * len(self.renderer.world.agents)
+        s, s_ = np.asarray(s), np.asarray(s_)
+        pos = np.rint(s[:n].reshape(-1, 2) * self._scale).astype(np.int16)
+        pos_ = np.rint(s_[:n].reshape(-1, 2) * self._scale).astype(np.int16)
+        memory = self.renderer.observation_memory(np.asarray(o)[:, :-1])
+        return [pos, memory, s[n:], a, r, pos_, s_[n:], c, p, done]
+
+    def _allocate(self, experience):
+        grid = self.renderer.world.grid
+        self._scale = np.array([grid.width, grid.height], dtype=np.float64)
+        super(RenderReplayBuffer, self)._allocate(self._split(experience))
+
+    def _write(self, row, experience):
+        super(RenderReplayBuffer, self)._write(row, self._split(experience))
+        check_every = FLAGS.replay_render_check
+        if self._n_written == 0 or (check_every > 0 and self._n_written % check_every == 0):
+            self._check(row, experience)
+        self._n_written += 1
+
+    def _check(self, row, experience):
+        # the observations have to come back as they were stored
+        try:
+            s, o, a, r, s_, o_, c, p, done = self._gather(np.array([row]))
+        except NotImplementedError:
+            raise ValueError("Scenario %s does not render observation batches for replay_render"
+                             % FLAGS.scenario)
+        if not (np.allclose(o[0], experience[1]) and np.allclose(o_[0], experience[5])):
+            raise ValueError("Observations of %s cannot be rendered from the state, stored transition %d differs"
+                             % (FLAGS.scenario, self._n_written))
+
+    def _gather(self, rows):
+        pos, memory, h, a, r, pos_, h_, c, p, done = [field[rows] for field in self.replay_memory]
+        o, memory_ = self.renderer.observation_batch(pos, memory)
+        o_, _ = self.renderer.observation_batch(pos_, memory_)
+        o = np.concatenate([o, h[..., None]], axis=-1)
+        o_ = np.concatenate([o_, h_[..., None]], axis=-1)
+        s = np.concatenate([(pos / self._scale).reshape(len(rows), -1), h], axis=-1)
+        s_ = np.concatenate([(pos_ / self._scale).reshape(len(rows), -1), h_], axis=-1)
+        return [s, o, a, r, s_, o_, c, p, done]
+
+
+class PrioritizedRenderReplayBuffer(PrioritizedReplayBuffer, RenderReplayBuffer):
+    """
+    PrioritizedReplayBuffer over RenderReplayBuffer storage
+    """
+
+    def __init__(self, rng=None, renderer=None):
+        super(PrioritizedRenderReplayBuffer, self).__init__(rng)
+        self.renderer = renderer
@@ -0,0 +1,95 @@
+from __future__ import print_function, division, absolute_import
+
+import asyncio
+import concurrent.futures
+
+
+class AsyncRolloutDriver(object):
+    """
+    Collect transitions from the envs of a SubprocVecMultiAgentEnv, each env
+    running as its own coroutine
+
+    An env coroutine picks actions with act_fn, sends the step to its worker
+    process and awaits the reply, then hands the transition to observe_fn.
+    act_fn and observe_fn run one at a time on a single executor thread, so
+    the TF session never sees concurrent calls. While one env waits for its
+    worker, inference and learner updates proceed for the others, and env
+    latency hides behind network compute.
+    """
+
+    def __init__(self, vec_env, act_fn, observe_fn):
+        """
+        :param vec_env: SubprocVecMultiAgentEnv
+        :param act_fn: act_fn(k, obs, state) -> (n_agents,) actions of env k
+        :param observe_fn: observe_fn(k, obs, state, action, reward, obs_next,
+                           state_next, done), called once per transition
+        """
+
+        self._vec_env = vec_env
+        self._act_fn = act_fn
+        self._observe_fn = observe_fn
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._loop = None
+        self._started = 0
+        self._n_steps = 0
+
+    def run(self, n_steps):
+        """
+        Reset the envs and collect n_steps transitions over all of them
+        """
+
+        self._started = 0
+        self._n_steps = n_steps
+        self._vec_env.reset()
+
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._run_all())
+        finally:
+            self._loop.close()
+            self._loop = None
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _call(self, fn, *args):
+        return self._loop.run_in_executor(self._executor, fn, *args)
+
+    def _step(self, k, action):
+        # resolved when the worker of env k replies, without blocking the loop
+        remote = self._vec_env.remotes[k]
+        done = self._loop.create_future()
+
+        def on_reply():
+            self._loop.remove_reader(remote.fileno())
+            try:
+                done.set_result(self._vec_env.step_env_wait(k))
+            except Exception as e:  # a failed worker
+                done.set_exception(e)
+
+        self._vec_env.step_env_async(k, action)
+        self._loop.add_reader(remote.fileno(), on_reply)
+        return done
+
+    async def _run_all(self):
+        await asyncio.gather(*[self._run_env(k) for k in range(self._vec_env.n_envs)])
+
+    async def _run_env(self, k):
+        vec_env = self._vec_env
+        obs, state = vec_env.obs[k].copy(), vec_env.state[k].copy()
+
+        while self._started < self._n_steps:
+            self._started += 1
+            action = await self._call(self._act_fn, k, obs, state)
+            _, reward, done, _ = await self._step(k, action)
+
+            reward, done = reward.copy(), done.copy()
+            if done.any():
+                # the env already started its next episode
+                obs_next = vec_env.terminal_obs[k].copy()
+                state_next = vec_env.terminal_state[k].copy()
+            else:
+                obs_next, state_next = vec_env.obs[k].copy(), vec_env.state[k].copy()
+
+            await self._call(self._observe_fn, k, obs, state, action, reward, obs_next, state_next, done)
+            obs, state = vec_env.obs[k].copy(), vec_env.state[k].copy()
@@ -83,8 +83,12 @@ class WeightGeneratorNetwork:
 
     def schedule_for_obs(self, obs_ph):
 
+        return self.schedules_for_obs(obs_ph)[0]
+
+    def schedules_for_obs(self, obs_ph):
+
         return self.sess.run(self.schedule_policy,
-                             feed_dict={self.obs_ph: obs_ph, self.is_training_ph: False})[0]
+                             feed_dict={self.obs_ph: obs_ph, self.is_training_ph: False})
 
     def target_schedule_for_obs(self, obs_ph):
 
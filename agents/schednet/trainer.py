@@ -21,9 +21,21 @@ epsilon_min = 0.1
 
 class Trainer(object):
 
-    def __init__(self, env):
+    def __init__(self, env, seed=None, learner=True):
+        """
+        :param learner: False for a trainer that only acts and tests, in a
+                        worker process: no GUI, critic or replay memory
+        """
+
         logger.info("SchedNet trainer is created")
 
+        # separate random streams for the trainer and the predator agent
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self._seed = seed
+        trainer_seed, agent_seed = seed.spawn(2)
+        self._rng = np.random.default_rng(trainer_seed)
+
         self._env = env
         self._eval = Evaluation()
         self._agent_profile = self._env.get_agent_profile()
@@ -38,20 +50,31 @@ class Trainer(object):
         self._predator_agent = PredatorAgent(n_agent=self._agent_profile['predator']['n_agent'],
                                              action_dim=self._agent_profile['predator']['act_dim'],
                                              state_dim=self._state_dim,
-                                             obs_dim=self._obs_dim)
-        # Prey agent (randomly moving)
-        self._prey_agent = []
-        for _ in range(self._n_prey):
-            self._prey_agent.append(RandomAgent(5))
+                                             obs_dim=self._obs_dim,
+                                             seed=agent_seed,
+                                             renderer=self._env,
+                                             learner=learner)
+        # Prey agents (randomly moving), drawing from the env random stream,
+        # which is looked up at every step since env.seed() replaces it
+        self._prey_agent = RandomAgent(5)
 
         self.epsilon = 0.5  # Init value for epsilon
+        self._evaluator = None  # for FLAGS.background_eval
 
-        if FLAGS.gui:  # Enable GUI
+        self._gui = FLAGS.gui and learner
+        if self._gui:  # Enable GUI
             self.canvas = canvas.Canvas(self._n_predator, 1, FLAGS.map_size)
             self.canvas.setup()
 
     def learn(self):
 
+        if FLAGS.n_actors > 0:
+            return self.learn_actor_learner()
+        if FLAGS.async_rollout:
+            return self.learn_async()
+        if FLAGS.n_envs > 1:
+            return self.learn_batched()
+
         global_step = 0
         episode_num = 0
         print_flag = True
@@ -77,7 +100,7 @@ class Trainer(object):
                 obs_n_without_schedule, reward_n, done_n, info_n = self._env.step(action_n)
                 obs_n_next, state_next, h_schedule_n = self.get_obs_state_with_schedule(obs_n_without_schedule, info_n, h_schedule_n, schedule_n)
 
-                if FLAGS.gui:
+                if self._gui:
                     self.canvas.draw(state_next * FLAGS.map_size, [0]*self._n_predator, "Train")
 
                 done_single = sum(done_n) > 0
@@ -88,26 +111,207 @@ class Trainer(object):
                 total_reward += np.sum(reward_n)
 
                 if is_episode_done(done_n, global_step):
-                    if FLAGS.gui:
+                    if self._gui:
                         self.canvas.draw(state_next * FLAGS.map_size, [0]*self._n_predator, "Train", True)
                     if print_flag:
                         print("[train_ep %d]" % (episode_num),"\tstep:", global_step, "\tstep_per_ep:", step_in_ep, "\treward", total_reward)
                     done = True
 
                 if FLAGS.eval_on_train and global_step % FLAGS.eval_step == 0:
-                    self.test(global_step)
-                    break
+                    self.test_on_train(global_step)
+                    if not FLAGS.background_eval:
+                        break
 
         self._predator_agent.save_nn(global_step)
+        self.finish_test_on_train()
+        self._predator_agent.close()
+        self._eval.summarize()
+
+    def learn_batched(self):
+        """
+        learn() over FLAGS.n_envs envs stepped in lockstep, with one batched
+        schedule and action selection per step for all of them
+        """
+
+        from envs.vec_env import SubprocVecMultiAgentEnv
+
+        n_envs = FLAGS.n_envs
+        vec_env = SubprocVecMultiAgentEnv(FLAGS.scenario, n_envs, seed=self._seed.spawn(1)[0])
+
+        global_step = 0
+        episode_num = 0
+        print_flag = True
+
+        obs, state = vec_env.reset()
+        h_schedule_n = np.zeros((n_envs, self._n_predator))  # schedule history per env
+        obs_n, state = self.stack_obs_state(obs, state, h_schedule_n)
+        total_reward = np.zeros(n_envs)
+        step_in_ep = np.zeros(n_envs, dtype=np.int64)
+
+        while global_step < training_step:
+            step_in_ep += 1
+
+            schedule_n, priority = self.get_schedule_batch(obs_n, global_step + 1)
+            action_n = self.get_action_batch(obs_n, schedule_n, global_step + 1)
+            obs_next, reward_n, done_n, state_next = vec_env.step(action_n)
+            done = done_n.any(axis=1)
+
+            # transitions of finished episodes end in their last observation
+            obs_next = np.where(done[:, None, None], vec_env.terminal_obs, obs_next)
+            state_next = np.where(done[:, None], vec_env.terminal_state, state_next)
+            h_schedule_n = self.update_h_schedule(h_schedule_n, schedule_n)
+            obs_n_next, state_next = self.stack_obs_state(obs_next, state_next, h_schedule_n)
+
+            for k in range(n_envs):
+                global_step += 1
+                self.train_agents(state[k], obs_n[k], action_n[k], reward_n[k], state_next[k], obs_n_next[k],
+                                  schedule_n[k], priority[k], done[k], source=k)
+                total_reward[k] += np.sum(reward_n[k])
+
+                if done[k]:
+                    episode_num += 1
+                    if print_flag:
+                        print("[train_ep %d]" % (episode_num), "\tstep:", global_step, "\tstep_per_ep:", step_in_ep[k], "\treward", total_reward[k])
+                    total_reward[k] = 0
+                    step_in_ep[k] = 0
+
+                if FLAGS.eval_on_train and global_step % FLAGS.eval_step == 0:
+                    self.test_on_train(global_step)
+
+            # envs that finished already started their next episode
+            h_schedule_n[done] = 0.0
+            obs_n, state = self.stack_obs_state(vec_env.obs, vec_env.state, h_schedule_n)
+
+        vec_env.close()
+        self._predator_agent.save_nn(global_step)
+        self.finish_test_on_train()
+        self._predator_agent.close()
+        self._eval.summarize()
+
+    def learn_async(self):
+        """
+        learn() over FLAGS.n_envs envs stepped in worker processes, with an
+        asyncio driver overlapping env steps with inference and updates
+        """
+
+        from envs.vec_env import SubprocVecMultiAgentEnv
+        from agents.schednet.rollout import AsyncRolloutDriver
+
+        vec_env = SubprocVecMultiAgentEnv(FLAGS.scenario, FLAGS.n_envs, seed=self._seed.spawn(1)[0])
+        h_schedule = np.zeros((FLAGS.n_envs, self._n_predator))  # schedule history per env
+        pending = [None] * FLAGS.n_envs  # schedule of the step in flight per env
+        total_reward = np.zeros(FLAGS.n_envs)
+        step_in_ep = np.zeros(FLAGS.n_envs, dtype=np.int64)
+        counter = {'global_step': 0, 'episode_num': 0}
+
+        def act(k, obs, state):
+            obs_n, state = self.stack_obs_state(obs, state, h_schedule[k])
+            global_step = counter['global_step'] + 1
+            schedule_n, priority = self.get_schedule(obs_n, global_step, FLAGS.sched)
+            action_n = self.get_action(obs_n, schedule_n, global_step)
+            pending[k] = (obs_n, state, schedule_n, priority)
+            return action_n
+
+        def observe(k, obs, state, action_n, reward_n, obs_next, state_next, done_n):
+            counter['global_step'] += 1
+            global_step = counter['global_step']
+            step_in_ep[k] += 1
+
+            obs_n, state, schedule_n, priority = pending[k]
+            h_schedule[k] = self.update_h_schedule(h_schedule[k], schedule_n)
+            obs_n_next, state_next = self.stack_obs_state(obs_next, state_next, h_schedule[k])
+
+            done_single = sum(done_n) > 0
+            self.train_agents(state, obs_n, action_n, reward_n, state_next, obs_n_next, schedule_n, priority, done_single,
+                              source=k)
+            total_reward[k] += np.sum(reward_n)
+
+            if done_single:
+                counter['episode_num'] += 1
+                print("[train_ep %d]" % (counter['episode_num']), "\tstep:", global_step, "\tstep_per_ep:", step_in_ep[k], "\treward", total_reward[k])
+                h_schedule[k] = 0.0
+                total_reward[k] = 0.0
+                step_in_ep[k] = 0
+
+            if FLAGS.eval_on_train and global_step % FLAGS.eval_step == 0:
+                self.test_on_train(global_step)
+
+        driver = AsyncRolloutDriver(vec_env, act, observe)
+        try:
+            driver.run(training_step)
+        finally:
+            driver.close()
+            vec_env.close()
+
+        self._predator_agent.save_nn(counter['global_step'])
+        self.finish_test_on_train()
+        self._predator_agent.close()
         self._eval.summarize()
 
+    def learn_actor_learner(self):
+        """
+        learn() with FLAGS.n_actors actor processes collecting transitions
+        with local copies of the policy, while this process only updates
+        the networks and sends the weights to the actors every
+        FLAGS.broadcast_every updates
+        """
+
+        from agents.schednet.actor_learner import ActorPool
+
+        pool = ActorPool(FLAGS.n_actors, self._seed.spawn(1)[0])
+        pool.broadcast(self._predator_agent.get_weights(), 0)
+
+        global_step = 0
+        episode_num = 0
+        update_cnt = 0
+        print_flag = True
+
+        try:
+            while global_step < training_step:
+                # wait for the actors only while there is too little to train on
+                warm = len(self._predator_agent.replay_buffer) >= FLAGS.pre_train_step * FLAGS.m_size
+                for actor, transitions, episodes in pool.receive(block=not warm):
+                    for transition in transitions:
+                        self._predator_agent.store_sample(*transition, source=actor)
+                    global_step += len(transitions)
+                    for step_in_ep, total_reward in episodes:
+                        episode_num += 1
+                        if print_flag:
+                            print("[train_ep %d]" % (episode_num), "\tstep:", global_step, "\tstep_per_ep:", step_in_ep, "\treward", total_reward)
+
+                    if FLAGS.eval_on_train and global_step // FLAGS.eval_step > (global_step - len(transitions)) // FLAGS.eval_step:
+                        self.test_on_train(global_step)
+
+                if warm:
+                    self._predator_agent.update_ac()
+                    update_cnt += 1
+                    if update_cnt % FLAGS.broadcast_every == 0:
+                        pool.broadcast(self._predator_agent.get_weights(), global_step)
+        finally:
+            pool.close()
+
+        logger.info("Learner: %d updates for %d transitions", update_cnt, global_step)
+        self._predator_agent.save_nn(global_step)
+        self.finish_test_on_train()
+        self._predator_agent.close()
+        self._eval.summarize()
+
+    def stack_obs_state(self, obs, state, h_schedule_n):
+        # get_obs_state_with_schedule for array-mode (..., n_agents, obs_dim)
+        # observations, with any leading env axis; preys get a zero history column
+        h = np.zeros(obs.shape[:-1] + (1,))
+        h[..., :self._n_predator, 0] = h_schedule_n
+        obs_n = np.concatenate((obs, h), axis=-1)
+        state = np.concatenate((state, h_schedule_n), axis=-1)
+        return obs_n, state
+
     def get_action(self, obs_n, schedule_n, global_step, train=True):
 
         act_n = [0] * len(obs_n)
         self.epsilon = max(self.epsilon - epsilon_dec, epsilon_min)
 
         # Action of predator
-        if train and (global_step < FLAGS.m_size * FLAGS.pre_train_step or np.random.rand() < self.epsilon):  # with prob. epsilon
+        if train and (global_step < FLAGS.m_size * FLAGS.pre_train_step or self._rng.random() < self.epsilon):  # with prob. epsilon
             # Exploration
             predator_action = self._predator_agent.explore()
         else:
@@ -119,18 +323,78 @@ class Trainer(object):
             act_n[idx] = predator_action[i]
 
         # Action of prey
+        prey_action = self._prey_agent.act_n(self._n_prey, rng=self._env.np_random)
         for i, idx in enumerate(self._agent_profile['prey']['idx']):
-            act_n[idx] = self._prey_agent[i].act(None)
+            act_n[idx] = prey_action[i]
 
         return np.array(act_n, dtype=np.int32)
 
+    def get_action_batch(self, obs_n, schedule_n, global_step, train=True):
+        """
+        get_action() for the (n_envs, n_agents, obs_dim) observations of
+        envs in lockstep, each env deciding on exploration on its own
+
+        :return: (n_envs, n_agents) array of actions
+        """
+
+        n_envs = len(obs_n)
+        act_n = np.zeros((n_envs, obs_n.shape[1]), dtype=np.int32)
+        self.epsilon = max(self.epsilon - epsilon_dec * n_envs, epsilon_min)
+        predator_idx = self._agent_profile['predator']['idx']
+
+        # Action of predator
+        explore = np.zeros(n_envs, dtype=bool)
+        if train:
+            explore = (global_step < FLAGS.m_size * FLAGS.pre_train_step) | (self._rng.random(n_envs) < self.epsilon)
+        if explore.any():
+            act_n[np.ix_(explore, predator_idx)] = self._predator_agent.explore_batch(explore.sum())
+        if not explore.all():
+            predator_obs = obs_n[~explore][:, predator_idx].reshape(-1, self._obs_dim * self._n_predator)
+            act_n[np.ix_(~explore, predator_idx)] = self._predator_agent.act_batch(predator_obs, schedule_n[~explore])
+
+        # Action of prey
+        prey_idx = self._agent_profile['prey']['idx']
+        act_n[:, prey_idx] = self._prey_agent.act_n(n_envs * self._n_prey,
+                                                    rng=self._env.np_random).reshape(n_envs, self._n_prey)
+
+        return act_n
+
+    def get_schedule_batch(self, obs_n, global_step, train=True):
+        """
+        get_schedule() for the observations of envs in lockstep
+
+        :return: (n_envs, n_predator) schedules and priorities
+        """
+
+        n_envs = len(obs_n)
+        schedule_n = np.zeros((n_envs, self._n_predator))
+        priority = np.zeros((n_envs, self._n_predator))
+
+        explore = np.zeros(n_envs, dtype=bool)
+        if train:
+            explore = (global_step < FLAGS.m_size * FLAGS.pre_train_step) | (self._rng.random(n_envs) < self.epsilon)
+        if explore.any():
+            # Exploration: Schedule k random agent
+            priority[explore] = self._rng.random((explore.sum(), self._n_predator))
+            i = np.argsort(-priority[explore], axis=1)[:, :FLAGS.s_num]
+            ret = np.zeros((explore.sum(), self._n_predator))
+            ret[np.arange(len(ret)).reshape(-1, 1), i] = 1.0
+            schedule_n[explore] = ret
+        if not explore.all():
+            # Exploitation
+            predator_idx = self._agent_profile['predator']['idx']
+            predator_obs = obs_n[~explore][:, predator_idx].reshape(-1, self._obs_dim * self._n_predator)
+            schedule_n[~explore], priority[~explore] = self._predator_agent.schedule_batch(predator_obs)
+
+        return schedule_n, priority
+
     def get_schedule(self, obs_n, global_step, type, train=True):
 
         predator_obs = [obs_n[i] for i in self._agent_profile['predator']['idx']]
 
-        if train and (global_step < FLAGS.m_size * FLAGS.pre_train_step or np.random.rand() < self.epsilon):
+        if train and (global_step < FLAGS.m_size * FLAGS.pre_train_step or self._rng.random() < self.epsilon):
             # Exploration: Schedule k random agent
-            priority = np.random.rand(self._n_predator)
+            priority = self._rng.random(self._n_predator)
             i = np.argsort(-priority)[:FLAGS.s_num]  
             ret = np.full(self._n_predator, 0.0)
             ret[i] = 1.0
@@ -139,14 +403,15 @@ class Trainer(object):
             # Exploitation
             return self._predator_agent.schedule(predator_obs)
 
-    def train_agents(self, state, obs_n, action_n, reward_n, state_next, obs_n_next, schedule_n, priority, done):
+    def train_agents(self, state, obs_n, action_n, reward_n, state_next, obs_n_next, schedule_n, priority, done,
+                     source=0):
         
         predator_obs = [obs_n[i] for i in self._agent_profile['predator']['idx']]
         predator_action = [action_n[i] for i in self._agent_profile['predator']['idx']]
         predator_reward = [reward_n[i] for i in self._agent_profile['predator']['idx']]
         predator_obs_next = [obs_n_next[i] for i in self._agent_profile['predator']['idx']]
         self._predator_agent.train(state, predator_obs, predator_action, predator_reward,
-                                   state_next, predator_obs_next, schedule_n, priority, done)
+                                   state_next, predator_obs_next, schedule_n, priority, done, source)
 
     def get_h_obs_state(self, obs_n, state, h_schedule):
         obs_n_h = np.concatenate((obs_n[0:self._n_predator], h_schedule.reshape((self._n_predator,1))), axis=1)
@@ -195,6 +460,62 @@ class Trainer(object):
     
     def test(self, curr_ep=None):
 
+        self.log_test_results([(curr_ep, self.run_test())])
+
+    def test_on_train(self, global_step):
+        # with FLAGS.background_eval, test a snapshot of the weights in the evaluation process
+        if not FLAGS.background_eval:
+            self.test(global_step)
+            return
+
+        from agents.schednet.evaluator import BackgroundEvaluator
+
+        if self._evaluator is None:
+            self._evaluator = BackgroundEvaluator(self._seed.spawn(1)[0])
+        self._evaluator.submit(self._predator_agent.get_weights(), global_step)
+        # finished snapshots go into self._eval like the results of test()
+        self.log_test_results(self._evaluator.poll())
+
+    def finish_test_on_train(self):
+        if self._evaluator is not None:
+            self.log_test_results(self._evaluator.close())
+            self._evaluator = None
+
+    def log_test_results(self, results):
+        for curr_ep, (global_step, episode_num, total_reward, obs_cnt) in results:
+            print("Test result: Average steps to capture: ", curr_ep, float(global_step) / episode_num,
+                  "\t", float(total_reward) / episode_num, obs_cnt / episode_num)
+            self._eval.update_value("test_result", float(global_step)/episode_num, curr_ep)
+
+    def test_parallel(self, n_seeds):
+        """
+        test() of the network in FLAGS.nn_file with n_seeds seeds, each
+        played in its own worker process
+        """
+
+        from agents.schednet.evaluator import evaluate, t_quantile_975
+
+        if FLAGS.nn_file == "":
+            logger.error("No file for loading Neural Network parameter")
+            exit()
+
+        steps = evaluate(FLAGS.nn_file, self._seed.spawn(n_seeds))
+        for k, value in enumerate(steps):
+            self._eval.update_value("test_result_seed", value, k)
+
+        mean = np.mean(steps)
+        std = np.std(steps, ddof=1) if n_seeds > 1 else 0.0
+        confidence = t_quantile_975(n_seeds - 1) * std / np.sqrt(n_seeds) if n_seeds > 1 else 0.0  # 95%
+        print("Test result over", n_seeds, "seeds: Average steps to capture: ", mean,
+              "\tstd", std, "\t95% CI", mean - confidence, mean + confidence)
+        result.info("test_result_parallel\t" + "\t".join(str(x) for x in [mean, std, confidence, n_seeds]))
+
+    def run_test(self):
+        """
+        :return: steps and episodes played, total reward, and per predator
+                 count of steps seeing the prey
+        """
+
         global_step = 0
         episode_num = 0
 
@@ -223,7 +544,7 @@ class Trainer(object):
 
                 obs_cnt += self.check_obs(obs_n_next)
 
-                if FLAGS.gui:
+                if self._gui:
                     self.canvas.draw(state_next * FLAGS.map_size, [0]*self._n_predator, "Test")
 
                 obs_n = obs_n_next
@@ -231,13 +552,11 @@ class Trainer(object):
                 total_reward += np.sum(reward_n)
 
                 if is_episode_done(done_n, global_step, "test") or step_in_ep > FLAGS.max_step:
-                    if FLAGS.gui:
+                    if self._gui:
                         self.canvas.draw(state_next * FLAGS.map_size, [0]*self._n_predator, "Test", True)
                     break
 
-        print("Test result: Average steps to capture: ", curr_ep, float(global_step) / episode_num,
-              "\t", float(total_reward) / episode_num, obs_cnt / episode_num)
-        self._eval.update_value("test_result", float(global_step)/episode_num, curr_ep)
+        return global_step, episode_num, total_reward, obs_cnt
 
 
 def is_episode_done(done, step, e_type="train"):
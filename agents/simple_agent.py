@@ -1,11 +1,18 @@
 import numpy as np
 
 class RandomAgent(object):
-    def __init__(self, action_dim):
+    def __init__(self, action_dim, rng=None):
         self._action_dim = action_dim
+        self._rng = rng if rng is not None else np.random.default_rng()
 
     def act(self, obs):
-        return np.random.randint(self._action_dim)
+        return self._rng.integers(self._action_dim)
+
+    def act_n(self, n, rng=None):
+        # actions of n agents in one draw, from rng if given
+        if rng is None:
+            rng = self._rng
+        return rng.integers(self._action_dim, size=n)
 
     def train(self, minibatch, step):
         return
@@ -5,13 +5,14 @@ from __future__ import division
 from __future__ import absolute_import
 import tensorflow as tf
 import logging
+import multiprocessing
 import time
 import envs.config_env as config_env
 import agents.config_agents as config_agent
 
 flags = tf.flags
 
-flags.DEFINE_integer("seed", 0, "Random seed number")
+flags.DEFINE_integer("seed", 1, "Random seed number")
 flags.DEFINE_string("folder", "default", "Result file folder name")
 
 config_env.config_env(flags)
@@ -28,16 +29,33 @@ result.setLevel(logging.INFO)
 
 if flags.FLAGS.folder == "default":
     log_filename = "./results/eval/r-" + file_name + ".txt"
-    result_fh = logging.FileHandler("./results/eval/r-" + file_name + ".txt")
     nn_filename = "./results/nn/n-" + file_name
 else:
     log_filename = "./results/eval/"+ flags.FLAGS.folder +"/r-" + file_name + ".txt"
-    result_fh = logging.FileHandler("./results/eval/"+ flags.FLAGS.folder +"/r-" + file_name + ".txt")
     nn_filename = "./results/nn/" + flags.FLAGS.folder + "/n-" + file_name
 
-result_fm = logging.Formatter('[%(filename)s:%(lineno)s] %(asctime)s\t%(message)s')
-result_fh.setFormatter(result_fm)
-result.addHandler(result_fh)
+# worker processes import this module too, only the main process writes results
+is_main_process = multiprocessing.current_process().name == 'MainProcess'
+if is_main_process:
+    result_fh = logging.FileHandler(log_filename)
+    result_fm = logging.Formatter('[%(filename)s:%(lineno)s] %(asctime)s\t%(message)s')
+    result_fh.setFormatter(result_fm)
+    result.addHandler(result_fh)
+else:
+    result.addHandler(logging.NullHandler())
+    result.propagate = False
+
+
+def flag_values():
+    # parsed flag values of this process, for set_flag_values() in a worker
+    return flags.FLAGS.flag_values_dict()
+
+
+def set_flag_values(values):
+    # take over the flags of the main process, before importing modules
+    # that read flags at import time
+    for name, value in values.items():
+        setattr(flags.FLAGS, name, value)
 
 
 
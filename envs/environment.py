@@ -13,10 +13,15 @@ class MultiAgentEnv(gym.Env):
 
     def __init__(self, world, reset_callback=None, reward_callback=None,
                  observation_callback=None, info_callback=None,
-                 done_callback=None, shared_viewer=True):
+                 done_callback=None, snapshot_callback=None,
+                 restore_callback=None, observation_batch_callback=None,
+                 observation_memory_callback=None, observation_binary_callback=None,
+                 shared_viewer=True, array_mode=False):
 
         self.world = world
         self.agents = self.world.agents
+        # random stream of this env, shared with the world
+        self.np_random = self.world.np_random
         # set required vectorized gym env property
         self.n = len(world.agents)
         # scenario callbacks
@@ -25,6 +30,11 @@ class MultiAgentEnv(gym.Env):
         self.observation_callback = observation_callback
         self.info_callback = info_callback
         self.done_callback = done_callback
+        self.snapshot_callback = snapshot_callback
+        self.restore_callback = restore_callback
+        self.observation_batch_callback = observation_batch_callback
+        self.observation_memory_callback = observation_memory_callback
+        self.observation_binary_callback = observation_binary_callback
       
         # environment parameters
         self.discrete_comm_space = True
@@ -65,6 +75,18 @@ class MultiAgentEnv(gym.Env):
             self.observation_space.append(spaces.Box(low=-np.inf, high=+np.inf, shape=(obs_dim,), dtype=np.float32))
             agent.action.c = np.zeros(self.world.dim_c)
 
+        # array mode: step() and reset() fill preallocated float32 buffers
+        # instead of building per-agent lists, observations are zero padded
+        # to the largest obs_dim
+        self.array_mode = array_mode
+        if self.array_mode:
+            self.obs_dim = [space.shape[0] for space in self.observation_space]
+            self._obs_buf = np.zeros((self.n, max(self.obs_dim)), dtype=np.float32)
+            self._reward_buf = np.zeros(self.n, dtype=np.float32)
+            self._done_buf = np.zeros(self.n, dtype=bool)
+            state_dim = len(self.get_info()[0].get('state', [])) if self.info_callback else 0
+            self._state_buf = np.zeros(state_dim, dtype=np.float32)
+
     def get_agent_profile(self):
         agent_profile = {}
 
@@ -99,6 +121,9 @@ class MultiAgentEnv(gym.Env):
         self.agents = self.world.agents
         self.world.step(action_n)
 
+        if self.array_mode:
+            return self._step_arrays()
+
         for agent in self.agents:
             obs_n.append(self._get_obs(agent))
             reward_n.append(self._get_reward(agent))
@@ -107,15 +132,77 @@ class MultiAgentEnv(gym.Env):
 
         return obs_n, reward_n, done_n, info_n
 
+    def seed(self, seed=None):
+        self.world.seed(seed)
+        self.np_random = self.world.np_random
+        return [seed]
+
     def reset(self):
         # reset world
         self.reset_callback(self.world)
 
+        return self._collect_obs()
+
+    # array mode step: (n_agents, obs_dim) observations, (n_agents,) rewards
+    # and dones and the global state, in buffers reused by the next call
+    def _step_arrays(self):
+        for i, agent in enumerate(self.agents):
+            obs = self._get_obs(agent)
+            self._obs_buf[i, :len(obs)] = obs
+            self._reward_buf[i] = self._get_reward(agent)
+            self._done_buf[i] = self._get_done(agent)
+        if len(self._state_buf):
+            self._state_buf[:] = self._get_info(self.agents[0])['state']
+        return self._obs_buf, self._reward_buf, self._done_buf, {'state': self._state_buf}
+
+    def _collect_obs(self):
+        if self.array_mode:
+            for i, agent in enumerate(self.agents):
+                obs = self._get_obs(agent)
+                self._obs_buf[i, :len(obs)] = obs
+            return self._obs_buf
+
         obs_n = []
         for agent in self.agents:
             obs_n.append(self._get_obs(agent))
         return obs_n
 
+    # state of the world and the scenario, for restore_state()
+    def clone_state(self):
+        scenario_state = None
+        if self.snapshot_callback is not None:
+            scenario_state = self.snapshot_callback(self.world)
+        return self.world.snapshot(), scenario_state, self.time
+
+    # go back to a state from clone_state() and observe it
+    def restore_state(self, state):
+        world_state, scenario_state, self.time = state
+        self.world.restore(world_state)
+        if self.restore_callback is not None:
+            self.restore_callback(self.world, scenario_state)
+
+        return self._collect_obs()
+
+    # predator observations for a batch of (B, n, 2) positions and predator
+    # memories, without changing the world; also returns the memories after
+    def observation_batch(self, pos, memory):
+        if self.observation_batch_callback is None:
+            raise NotImplementedError()
+        return self.observation_batch_callback(self.world, pos, memory)
+
+    # predator memories held by predator observations
+    def observation_memory(self, obs):
+        if self.observation_memory_callback is None:
+            return np.asarray(obs)[..., :0]
+        return self.observation_memory_callback(obs)
+
+    # mask of the predator observation features that are always 0 or 1,
+    # None when the scenario does not tell
+    def observation_binary(self):
+        if self.observation_binary_callback is None:
+            return None
+        return self.observation_binary_callback(self.world)
+
     # get info used for benchmarking
     def _get_info(self, agent):
         if self.info_callback is None:
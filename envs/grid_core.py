@@ -1,3 +1,4 @@
+import collections
 import numpy as np
 import config
 
@@ -11,6 +12,16 @@ O = 2
 W = 3
 S = 4
 
+# (dx, dy) for each action, indexed by action id
+MOVES = np.array([[0, -1], [-1, 0], [0, 0], [1, 0], [0, 1]], dtype=np.int64)
+
+# blocker codes used by resolve_moves()
+FREE = -1
+BLOCKED = -2
+
+# state of a World recorded by World.snapshot()
+Snapshot = collections.namedtuple('Snapshot', ['pos', 'step_cnt', 'collided', 'memory', 'obs'])
+
 # action of the agent
 class Action(object):
     def __init__(self):
@@ -56,8 +67,6 @@ class CoreAgent(Entity):
         self.silent = True
         # action
         self.action = Action()
-        # if waiting for other agents action
-        self.waiting = False
         # if done doing its action in the current step
         self.done_moving = False
         # if the intended step collided 
@@ -68,6 +77,16 @@ class CoreAgent(Entity):
         self._y = 0
         self.obs_range = 1
 
+    def get_memory(self):
+        """
+        Values the agent carries over between steps, other than its
+        position, as a list of numbers
+        """
+        return []
+
+    def set_memory(self, memory):
+        pass
+
     def update_obs(self, obs):
         self._obs = obs
 
@@ -81,6 +100,13 @@ class Wall(Entity):
 class Grid(object):
     """
     Represent a grid and operations on it
+
+    Cell contents are kept twice: as entity objects for get() and as an
+    int16 (height, width, 3) type/color/id encoding that set() keeps in sync,
+    so that encode() does not have to walk the grid. The encoding is int16
+    rather than int8 so that agent ids above 127 fit. It lives inside a
+    buffer padded with walls, from which observation windows are read
+    without bounds checks.
     """
 
     def __init__(self, width, height):
@@ -89,12 +115,33 @@ class Grid(object):
 
         self.width = width
         self.height = height
+        self.pad = 0
+        self._set_pad(1)
         self.reset()
 
+    def _set_pad(self, pad):
+        padded = np.empty(shape=(self.height + 2 * pad, self.width + 2 * pad, 3), dtype=np.int16)
+        padded[:] = WALL_CELL
+        encoded = padded[pad:pad + self.height, pad:pad + self.width]
+        if self.pad > 0:
+            encoded[:] = self._encoded
+
+        self.pad = pad
+        self._padded = padded
+        self._encoded = encoded
+        self._padded_view = padded.view()
+        self._padded_view.flags.writeable = False
+        self._encoded_view = encoded.view()
+        self._encoded_view.flags.writeable = False
+
     def set(self, i, j, v):
         assert i >= 0 and i < self.width
         assert j >= 0 and j < self.height
-        self.grid[j * self.width + i] = v
+        c = j * self.width + i
+        if (self.grid[c] is None) != (v is None):
+            self._swap_free(c, v is None)
+        self.grid[c] = v
+        self._encoded[j, i] = encode_cell(v)
 
     def get(self, i, j):
         if ((i >= 0 and i < self.width) and \
@@ -105,6 +152,59 @@ class Grid(object):
 
     def reset(self):
         self.grid = [None] * self.width * self.height
+        self._encoded.fill(0)
+        # every cell is empty, so the free index is the identity
+        self._free = list(range(len(self.grid)))
+        self._free_at = list(range(len(self.grid)))
+        self.n_free = len(self.grid)
+
+    def _index_free(self):
+        # cells are numbered j * width + i; the first n_free entries of
+        # _free are the empty cells in no particular order, and _free_at
+        # gives the position of every cell in _free. For grids filled
+        # outside of reset(), e.g. by slice()
+        self._free = sorted(range(len(self.grid)), key=lambda c: self.grid[c] is not None)
+        self._free_at = [0] * len(self._free)
+        for k, c in enumerate(self._free):
+            self._free_at[c] = k
+        self.n_free = sum(v is None for v in self.grid)
+
+    def _swap_free(self, c, free):
+        # move cell c across the boundary between empty and filled cells
+        if free:
+            k = self.n_free
+            self.n_free += 1
+        else:
+            self.n_free -= 1
+            k = self.n_free
+        d = self._free[k]
+        a = self._free_at[c]
+        self._free[a], self._free[k] = d, c
+        self._free_at[d], self._free_at[c] = a, k
+
+    def draw_free(self, rng):
+        """
+        Draw an empty cell uniformly at random
+
+        :param rng: np.random.Generator to draw from
+        :return: (x, y) of the cell
+        """
+
+        c = self._free[rng.integers(self.n_free)]
+        return c % self.width, c // self.width
+
+    def sample_free(self, size, rng):
+        """
+        Draw distinct empty cells uniformly at random, without replacement
+
+        :param size: number of cells to draw
+        :param rng: np.random.Generator to draw from
+        :return: (xs, ys) arrays of the cells
+        """
+
+        slots = rng.choice(self.n_free, size, replace=False)
+        cells = np.array([self._free[k] for k in slots.tolist()], dtype=np.int64)
+        return cells % self.width, cells // self.width
 
     def setHorzWall(self, x, y, length=None):
         if length is None:
@@ -130,44 +230,87 @@ class Grid(object):
         """
 
         grid = Grid(width, height)
+        grid.grid = [self.get(topX + i, topY + j)
+                     for j in range(0, height) for i in range(0, width)]
+        grid._index_free()
 
-        for j in range(0, height):
-            for i in range(0, width):
-                x = topX + i
-                y = topY + j
-
-                if x >= 0 and x < self.width and \
-                   y >= 0 and y < self.height:
-                    v = self.get(x, y)
-                else:
-                    v = Wall()
-
-                grid.set(i, j, v)
+        # cells outside of this grid are walls
+        grid._encoded[:] = WALL_CELL
+        x0, x1 = max(topX, 0), min(topX + width, self.width)
+        y0, y1 = max(topY, 0), min(topY + height, self.height)
+        if x0 < x1 and y0 < y1:
+            grid._encoded[y0-topY:y1-topY, x0-topX:x1-topX] = self._encoded[y0:y1, x0:x1]
 
         return grid
 
     def encode(self):
         """
         Produce a compact numpy encoding of the grid
+
+        The returned (height, width, 3) int16 array is a read-only view that
+        follows later updates of the grid; copy it to keep a snapshot.
         """
 
-        array = np.zeros(shape=(self.height, self.width, 3), dtype=np.int8)
+        return self._encoded_view
 
-        for j in range(0, self.height):
-            for i in range(0, self.width):
+    def window(self, x, y, r):
+        """
+        Encoding of the (2r+1, 2r+1) square centered on (x, y)
 
-                v = self.get(i, j)
-                if isinstance(v, CoreAgent):
-                    array[j, i, 2] = v.id
+        Cells outside of the grid are encoded as walls. The result is a
+        read-only view into the grid, no data is copied.
+        """
 
-                if v == None:
-                    continue
+        if r > self.pad:
+            self._set_pad(r)
+        p = self.pad
+        return self._padded_view[y+p-r:y+p+r+1, x+p-r:x+p+r+1]
 
+    def blocked_neighbours(self):
+        """
+        Number of blocked N/E/W/S neighbours of every cell
 
-                array[j, i, 0] = OBJECT_TO_IDX[v.itype]
-                array[j, i, 1] = COLOR_TO_IDX[v.color]
+        A neighbour is blocked when it holds a wall or any entity; cells
+        outside of the grid count as walls. Computed with four shifted
+        slices of the padded buffer.
 
-        return array
+        :return: (height, width) int8 array
+        """
+
+        p, h, w = self.pad, self.height, self.width
+        blocked = (self._padded[:, :, 0] != 0).view(np.int8)
+        return (blocked[p-1:p-1+h, p:p+w] + blocked[p+1:p+1+h, p:p+w]
+                + blocked[p:p+h, p-1:p-1+w] + blocked[p:p+h, p+1:p+1+w])
+
+    def windows(self, xs, ys, r):
+        """
+        Encodings of the (2r+1, 2r+1) squares centered on each (xs[k], ys[k]),
+        gathered with a single index into the padded buffer
+
+        :return: (len(xs), 2r+1, 2r+1, 3) int16 array
+        """
+
+        if r > self.pad:
+            self._set_pad(r)
+        d = np.arange(-r, r + 1) + self.pad
+        ys = np.asarray(ys)[:, None, None] + d[:, None]
+        xs = np.asarray(xs)[:, None, None] + d[None, :]
+        return self._padded[ys, xs]
+
+
+def encode_cell(v):
+    """
+    Encoding (type, color, id) of a single cell content
+    """
+
+    if v is None:
+        return 0, 0, 0
+
+    idx = v.id if isinstance(v, CoreAgent) else 0
+    return OBJECT_TO_IDX[v.itype], COLOR_TO_IDX[v.color], idx
+
+
+WALL_CELL = encode_cell(Wall())
 
 
 # multi-agent world
@@ -188,15 +331,63 @@ class World(object):
         self.grid.wallRect(0, 0, self.width, self.height)
 
         self.step_cnt = 0
+        # values derived from the current state, see cached()
+        self.cache = {}
+        self.seed()
+
+    def seed(self, seed=None):
+        """
+        Give the world its own random stream for placing objects
+
+        :param seed: int, np.random.SeedSequence or None for fresh entropy
+        """
+        self.np_random = np.random.default_rng(seed)
+
+    @property
+    def agents(self):
+        return self._agents
+
+    @agents.setter
+    def agents(self, agents):
+        """
+        Agent positions are mirrored in self.pos, an (n_agents, 2) array of
+        (x, y) whose k-th row belongs to agents[k], and self.agent_index maps
+        agent ids to those rows. Ids have to be assigned before the agents
+        are set.
+        """
+        self._agents = agents
+        self.pos = np.array([agent.pos for agent in agents], dtype=np.int64).reshape(-1, 2)
+        self.agent_index = dict((agent.id, k) for k, agent in enumerate(agents))
+        self._memory_len = [len(agent.get_memory()) for agent in agents]
 
     def empty_grid(self):
         self.step_cnt = 0
         self.grid.reset()
+        self.cache = {}
+
+    def cached(self, key, fn):
+        """
+        Value of fn(), computed once per state of the world
+
+        Lets the per-agent scenario callbacks share work such as captures or
+        the global state. The cache is dropped whenever agents are placed or
+        moved, or the world is restored.
+
+        :param key: name of the value
+        :param fn: function computing the value from the world
+        """
+
+        if key not in self.cache:
+            self.cache[key] = fn()
+        return self.cache[key]
 
     def placeObj(self, obj, top=None, size=None, reject_fn=None):
         """
         Place an object at an empty position in the grid
 
+        Candidates are drawn from the empty cells of the grid only, so
+        dense maps do not slow the search down.
+
         :param top: top-left position of the rectangle where to place
         :param size: size of the rectangle where to randomly place
         :param reject_fn: function to filter out potential positions
@@ -209,13 +400,11 @@ class World(object):
             size = (self.grid.width, self.grid.height)
 
         while True:
-            pos = (
-                np.random.randint(top[0], top[0] + size[0]),
-                np.random.randint(top[1], top[1] + size[1])
-            )
+            pos = self.grid.draw_free(self.np_random)
 
-            # Don't place the object on top of another object
-            if self.grid.get(*pos) != None:
+            # Keep to the requested rectangle
+            if not (top[0] <= pos[0] < top[0] + size[0] and
+                    top[1] <= pos[1] < top[1] + size[1]):
                 continue
 
             # Check if there is a filtering criterion
@@ -226,48 +415,133 @@ class World(object):
 
         self.grid.set(pos[0], pos[1], obj)
         obj.set_pos(pos[0], pos[1])
+        if isinstance(obj, CoreAgent):
+            self.pos[self.agent_index[obj.id]] = pos
+        self.cache = {}
         return pos
 
-    def single_agent_step(self, agent, action):
-        if agent.done_moving or agent.waiting:
-            return
+    def place_agents(self, agents, reject_fn=None):
+        """
+        Place agents at distinct empty cells drawn uniformly at random
 
-        x, y = agent.pos
-        action = agent.action.u
-
-        if   action == N:
-            y -= 1
-        elif action == E:
-            x -= 1
-        elif action == W:
-            x += 1
-        elif action == S:
-            y += 1
-        elif action == O:
-            agent.done_moving = True
-            agent.collided = False
+        All cells are drawn at once, without replacement. With reject_fn
+        the agents are placed one at a time through placeObj instead, so
+        that the filter sees the agents placed before.
+
+        :param agents: agents of this world to place
+        :param reject_fn: function to filter out potential positions
+        """
+
+        if reject_fn is not None:
+            for agent in agents:
+                self.placeObj(agent, reject_fn=reject_fn)
             return
 
-        intended_cell = self.grid.get(x, y)
-        if isinstance(intended_cell, CoreAgent):
-            agent.waiting = True
-            # let the other agent move first
-            self.single_agent_step(intended_cell, intended_cell.action.u)
-            agent.waiting = False
-            # get the intended cell (to check if it is empty)
-            intended_cell = self.grid.get(x, y)
-
-        # check if the intended cell is empty
-        if not intended_cell is None:  
-            agent.collided = True
-        else:
-            x_0, y_0 = agent.pos
-            self.grid.set(x_0, y_0, None)
+        xs, ys = self.grid.sample_free(len(agents), self.np_random)
+        for agent, x, y in zip(agents, xs.tolist(), ys.tolist()):
             self.grid.set(x, y, agent)
             agent.set_pos(x, y)
+        rows = [self.agent_index[agent.id] for agent in agents]
+        self.pos[rows, 0] = xs
+        self.pos[rows, 1] = ys
+        self.cache = {}
+
+    def move_agents(self, action):
+        """
+        Move every agent by its action
+
+        Steps where no agent heads into an occupied cell or into the same
+        cell as another agent are applied directly; otherwise the moves go
+        through resolve_agent_moves().
+
+        :param action: (n_agents,) array of action ids
+        """
+
+        action = np.asarray(action).tolist()
+        steps = MOVES.tolist()
+        target = []
+        conflict = False
+        claimed = set()
+        for agent, a in zip(self.agents, action):
+            x, y = agent.pos
+            dx, dy = steps[a]
+            t = (x + dx, y + dy)
+            target.append(t)
+            if a != O:
+                v = self.grid.get(*t)
+                if isinstance(v, CoreAgent) or (v is None and t in claimed):
+                    conflict = True
+                claimed.add(t)
+
+        if conflict:
+            self.resolve_agent_moves(action, target)
+            return
+
+        for k, (agent, a, (x, y)) in enumerate(zip(self.agents, action, target)):
+            agent.done_moving = True
             agent.collided = False
+            if a == O:
+                continue
+            if self.grid.get(x, y) is None:
+                self.grid.set(agent.pos[0], agent.pos[1], None)
+                self.grid.set(x, y, agent)
+                agent.set_pos(x, y)
+                self.pos[k] = x, y
+            else:
+                agent.collided = True
+
+    def resolve_agent_moves(self, action, target):
+        """
+        Move agents whose intended cells may be taken by other agents
+
+        Agents are handled in index order, and an agent heading into a cell
+        held by another agent lets that agent move first. The chain of
+        agents waiting on each other is followed with an explicit stack, so
+        long queues cost one visit per agent and no recursion; agents
+        waiting on each other in a cycle all collide.
+
+        :param action: list of action ids
+        :param target: list of intended (x, y) cells
+        """
+
+        pending, waiting, done = 0, 1, 2
+        state = [pending] * len(self.agents)
+
+        for i in range(len(self.agents)):
+            stack = [i]
+            while stack:
+                k = stack[-1]
+                if state[k] == done:
+                    stack.pop()
+                    continue
 
-        agent.done_moving = True
+                agent = self.agents[k]
+                if action[k] == O:
+                    agent.collided = False
+                else:
+                    x, y = target[k]
+                    intended_cell = self.grid.get(x, y)
+                    if state[k] == pending and isinstance(intended_cell, CoreAgent):
+                        j = self.agent_index[intended_cell.id]
+                        if state[j] == pending:
+                            # let the other agent move first
+                            state[k] = waiting
+                            stack.append(j)
+                            continue
+
+                    if intended_cell is None:
+                        x_0, y_0 = agent.pos
+                        self.grid.set(x_0, y_0, None)
+                        self.grid.set(x, y, agent)
+                        agent.set_pos(x, y)
+                        self.pos[k] = x, y
+                        agent.collided = False
+                    else:
+                        agent.collided = True
+
+                agent.done_moving = True
+                state[k] = done
+                stack.pop()
 
     # update state of the world
     def step(self, action_n):
@@ -276,18 +550,307 @@ class World(object):
         for i, agent in enumerate(self.agents):
             agent.action.u = action_n[i]
             agent.done_moving = False
-            
+
         # do the action
-        for agent in self.agents:
-            self.single_agent_step(agent, agent.action.u)
+        self.move_agents(action_n)
 
         # update observations of all agents
         self.set_observations()
 
-    def set_observations(self):
-        for agent in self.agents:
-            x, y = agent.pos
-            r = agent.obs_range
-            obs = self.grid.slice(x-r, y-r,r*2+1,r*2+1)
+    def snapshot(self):
+        """
+        Record the state of the world in a few small arrays
+
+        Agents are the only entities that move, so the record holds their
+        positions and memories and no entity objects are copied. Walls and
+        other static entities are expected to be unchanged at restore().
+        Observation arrays are replaced rather than written to on every
+        step, so the current ones are kept by reference.
+
+        :return: Snapshot
+        """
+
+        memory = np.full((len(self.agents), max(self._memory_len or [0])), np.nan)
+        for k, agent in enumerate(self.agents):
+            if self._memory_len[k]:
+                memory[k, :self._memory_len[k]] = agent.get_memory()
+
+        return Snapshot(pos=self.pos.copy(),
+                        step_cnt=self.step_cnt,
+                        collided=np.array([agent.collided for agent in self.agents], dtype=bool),
+                        memory=memory,
+                        obs=[agent.get_obs() for agent in self.agents])
+
+    def restore(self, snap):
+        """
+        Put the world back in the state recorded by snapshot()
+
+        :param snap: Snapshot of this world
+        """
+
+        for x, y in self.pos.tolist():
+            self.grid.set(x, y, None)
+        for agent, (x, y), collided in zip(self.agents, snap.pos.tolist(), snap.collided.tolist()):
+            self.grid.set(x, y, agent)
+            agent.set_pos(x, y)
+            agent.collided = collided
+        self.pos[:] = snap.pos
+
+        for k, agent in enumerate(self.agents):
+            if self._memory_len[k]:
+                agent.set_memory(snap.memory[k, :self._memory_len[k]].tolist())
+
+        for agent, obs in zip(self.agents, snap.obs):
             agent.update_obs(obs)
-            
\ No newline at end of file
+
+        self.step_cnt = snap.step_cnt
+        self.cache = {}
+
+    def set_observations(self):
+        self.cache = {}
+        # one gather per observation range instead of a slice per agent
+        for r in set(agent.obs_range for agent in self.agents):
+            group = [agent for agent in self.agents if agent.obs_range == r]
+            xs = [agent.pos[0] for agent in group]
+            ys = [agent.pos[1] for agent in group]
+            obs = self.grid.windows(xs, ys, r)
+            for agent, o in zip(group, obs):
+                agent.update_obs(o)
+
+
+def resolve_moves(blocker, cell, stay, n_cell):
+    """
+    Decide which agents move, for a batch of worlds at once
+
+    Gives the same outcome as World.move_agents, where agents are handled
+    in index order and an agent first lets the agent on its target cell
+    move: agents waiting on each other in a cycle all collide, and a cell
+    is taken by whichever claimant was reached first. Runs in at most
+    O(log n) array passes over all worlds.
+
+    :param blocker: (B, n) index of the agent on the target cell, FREE if
+                    the cell is empty, BLOCKED for walls and the map border
+    :param cell: (B, n) id of the target cell, in [0, n_cell)
+    :param stay: (B, n) agents that do not move this step
+    :return: (B, n) boolean array of the agents that moved
+    """
+
+    n_world, n = blocker.shape
+    passes = (n - 1).bit_length()
+    world = np.arange(n_world)[:, None]
+    nxt = np.where((blocker >= 0) & ~stay, blocker + world * n, -1).ravel()
+
+    # lowest index among the agents waiting (directly or through a chain)
+    # on each agent, which is when that agent gets its turn
+    turn = np.tile(np.arange(n), n_world)
+    anc = nxt
+    for _ in range(passes):
+        has = anc >= 0
+        if not has.any():
+            break
+        np.minimum.at(turn, anc[has], turn[has])
+        anc = np.where(has, anc[anc], -1)
+
+    # among agents claiming the same cell, the one with the earliest turn wins
+    claim = (~stay & (blocker != BLOCKED)).ravel()
+    slot = (cell + world * n_cell).ravel()
+    first = np.full(n_world * n_cell, n)
+    np.minimum.at(first, slot[claim], turn[claim])
+    ok = claim & (turn == first[slot])
+
+    # an agent moves if it wins its cell and everything it waits on moves
+    for _ in range(passes):
+        has = nxt >= 0
+        if not has.any():
+            break
+        ok = np.where(has, ok & ok[nxt], ok)
+        nxt = np.where(has, nxt[nxt], -1)
+
+    return (ok & (nxt < 0)).reshape(n_world, n)
+
+
+def type_windows(width, height, types, pos, idx, r):
+    """
+    Object types in the observation windows of agents, for a batch of
+    empty worlds holding only the agents at pos
+
+    Gives the type channel of Grid.windows() of the world in that state,
+    with walls outside of the grid.
+
+    :param types: (n_agents,) object type of each agent
+    :param pos: (B, n_agents, 2) array of (x, y)
+    :param idx: agents whose windows are returned
+    :return: (B, len(idx), 2r+1, 2r+1) array of object types
+    """
+
+    pos = np.asarray(pos)
+    worlds = np.arange(len(pos))[:, None]
+    grid = np.full((len(pos), height + 2 * r, width + 2 * r), OBJECT_TO_IDX['wall'], dtype=np.int16)
+    grid[:, r:r + height, r:r + width] = OBJECT_TO_IDX['empty']
+    grid[worlds, pos[:, :, 1] + r, pos[:, :, 0] + r] = types
+
+    d = np.arange(2 * r + 1)
+    ys = pos[:, idx, 1, None, None] + d[:, None]
+    xs = pos[:, idx, 0, None, None] + d[None, :]
+    return grid[worlds[:, :, None, None], ys, xs]
+
+
+# object types of the wall, predator and prey feature planes
+PLANE_TYPES = np.array([OBJECT_TO_IDX['wall'], OBJECT_TO_IDX['predator'], OBJECT_TO_IDX['prey']])
+
+
+def window_features(types):
+    """
+    Wall/predator/prey planes of observation windows and the prey seen in
+    them, the prey position being the last prey cell in row-major order
+
+    :param types: (..., 2r+1, 2r+1) object types of the windows
+    :return: (..., 2r+1, 2r+1, 3) boolean planes, and (..., 3) array of the
+             prey-seen flag and the prey coordinates (px, py), -1 when no
+             prey is seen
+    """
+
+    planes = types[..., None] == PLANE_TYPES
+    obs_size = types.shape[-1]
+    prey_cells = planes[..., 2].reshape(types.shape[:-2] + (-1,))
+    seen = prey_cells.any(axis=-1)
+    coor_prey = obs_size * obs_size - 1 - np.argmax(prey_cells[..., ::-1], axis=-1)
+    prey = np.zeros(types.shape[:-2] + (3,))
+    prey[..., 0] = seen
+    prey[..., 1] = np.where(seen, (coor_prey // obs_size) / (obs_size - 1), -1.0)
+    prey[..., 2] = np.where(seen, (coor_prey % obs_size) / (obs_size - 1), -1.0)
+    return planes, prey
+
+
+class VecWorld(object):
+    """
+    Batch of independent predator-prey worlds stepped with array operations
+
+    Agent k of every world has id k + 1, predators first, as in the
+    scenarios. Positions are kept as a (B, n_agents, 2) array of (x, y) and
+    occupancy as a (B, height, width) array of agent ids padded with walls
+    (-1) so that observation windows never leave the array.
+    """
+
+    def __init__(self, n_world, width, height, n_predator, n_prey, obs_range=1):
+        self.n_world = n_world
+        self.width = width
+        self.height = height
+        self.n_predator = n_predator
+        self.n_prey = n_prey
+        self.n_agents = n_predator + n_prey
+        self.obs_range = obs_range
+        self.pad = max(obs_range, 1)
+
+        self.pos = np.zeros((n_world, self.n_agents, 2), dtype=np.int64)
+        self.occupancy = np.full((n_world, height + 2 * self.pad, width + 2 * self.pad), -1, dtype=np.int16)
+        self.collided = np.zeros((n_world, self.n_agents), dtype=bool)
+        self.step_cnt = np.zeros(n_world, dtype=np.int64)
+
+        # object type (as in Grid.encode) for occupancy value + 1
+        self.id_to_type = np.array([OBJECT_TO_IDX['wall'], OBJECT_TO_IDX['empty']]
+                                   + [OBJECT_TO_IDX['predator']] * n_predator
+                                   + [OBJECT_TO_IDX['prey']] * n_prey, dtype=np.int8)
+
+        self._worlds = np.arange(n_world)[:, None]
+        d = np.arange(-obs_range, obs_range + 1)
+        self._win_y = d[:, None]
+        self._win_x = d[None, :]
+
+        self.seed()
+        self.reset()
+
+    def seed(self, seed=None):
+        """
+        :param seed: int, np.random.SeedSequence or None for fresh entropy
+        """
+        self.np_random = np.random.default_rng(seed)
+
+    def reset(self, mask=None):
+        """
+        Place all agents at random empty cells
+
+        :param mask: (B,) boolean array of the worlds to reset, all if None
+        """
+
+        if mask is None:
+            mask = np.ones(self.n_world, dtype=bool)
+        worlds = np.flatnonzero(mask)
+        if len(worlds) == 0:
+            return
+
+        # n_agents distinct cells per world
+        keys = self.np_random.random((len(worlds), self.width * self.height))
+        cells = np.argsort(keys, axis=1)[:, :self.n_agents]
+
+        p = self.pad
+        self.occupancy[worlds, p:p + self.height, p:p + self.width] = 0
+        self.pos[worlds, :, 0] = cells % self.width
+        self.pos[worlds, :, 1] = cells // self.width
+        self._fill(worlds)
+
+        self.collided[worlds] = False
+        self.step_cnt[worlds] = 0
+
+    def _fill(self, worlds):
+        p = self.pad
+        ids = np.arange(1, self.n_agents + 1, dtype=self.occupancy.dtype)
+        pos = self.pos[worlds]
+        self.occupancy[worlds[:, None], pos[:, :, 1] + p, pos[:, :, 0] + p] = ids
+
+    def step(self, action):
+        """
+        Move the agents of all worlds
+
+        :param action: (B, n_agents) array of action ids
+        """
+
+        action = np.asarray(action)
+        self.step_cnt += 1
+        p = self.pad
+
+        target = self.pos + MOVES[action]
+        tx = target[:, :, 0] + p
+        ty = target[:, :, 1] + p
+        stay = action == O
+
+        occupant = self.occupancy[self._worlds, ty, tx].astype(np.int64)
+        blocker = np.where(occupant > 0, occupant - 1, np.where(occupant == 0, FREE, BLOCKED))
+        n_cell = self.occupancy.shape[1] * self.occupancy.shape[2]
+        moved = resolve_moves(blocker, ty * self.occupancy.shape[2] + tx, stay, n_cell)
+
+        b, k = np.nonzero(moved)
+        self.occupancy[b, self.pos[b, k, 1] + p, self.pos[b, k, 0] + p] = 0
+        self.occupancy[b, ty[b, k], tx[b, k]] = k + 1
+        self.pos[b, k] = target[b, k]
+        self.collided = ~moved & ~stay
+
+    def observe(self):
+        """
+        Observation windows of all agents
+
+        :return: (B, n_agents, 2r+1, 2r+1) array of occupancy ids centered
+                 on each agent, -1 for walls
+        """
+
+        p = self.pad
+        ys = self.pos[:, :, 1, None, None] + p + self._win_y
+        xs = self.pos[:, :, 0, None, None] + p + self._win_x
+        return self.occupancy[self._worlds[:, :, None, None], ys, xs]
+
+    def captured(self):
+        """
+        Capture check of all preys
+
+        :return: (B, n_prey) boolean array, True when all four neighbours
+                 of the prey are walls or agents
+        """
+
+        p = self.pad
+        prey = self.pos[:, self.n_predator:]
+        x = prey[:, :, 0] + p
+        y = prey[:, :, 1] + p
+        w = self._worlds
+        occ = self.occupancy
+        return (occ[w, y - 1, x] != 0) & (occ[w, y + 1, x] != 0) & \
+               (occ[w, y, x - 1] != 0) & (occ[w, y, x + 1] != 0)
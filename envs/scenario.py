@@ -1,4 +1,7 @@
 import numpy as np
+import config
+
+OBJECT_TO_IDX = config.OBJECT_TO_IDX
 
 # defines scenario upon which the world is built
 class BaseScenario(object):
@@ -15,4 +18,49 @@ class BaseScenario(object):
     def info(self, agent, world):
         raise NotImplementedError()
     def done(self, agent, world):
-        raise NotImplementedError()
\ No newline at end of file
+        raise NotImplementedError()
+    # scenario state not held by the world, for MultiAgentEnv.clone_state()
+    def snapshot(self, world):
+        return None
+    def restore(self, world, state):
+        pass
+    # observation() of the predators for a batch of positions and predator memories
+    def observation_batch(self, world, pos, memory):
+        raise NotImplementedError()
+    # predator memory after observing, read back from predator observations
+    def observation_memory(self, obs):
+        return np.asarray(obs)[..., :0]
+    # mask of the predator observation features that are always 0 or 1, e.g.
+    # for a replay memory to keep them in one byte; None when not known
+    def observation_binary(self, world):
+        return None
+    # prey agents with all four neighbouring cells blocked, as a mask over
+    # world.agents, from one pass over the grid per step
+    def captured(self, world):
+        def capture_mask():
+            blocked = world.grid.blocked_neighbours()[world.pos[:, 1], world.pos[:, 0]] == 4
+            prey = np.zeros(len(world.agents), dtype=bool)
+            prey[self.atype_to_idx['prey']] = True
+            return blocked & prey
+        return world.cached('captured', capture_mask)
+    # n_agents * (x,y) over the grid size, row k holds the agent with id k+1,
+    # shared by all agents
+    def coord_state(self, world):
+        size = np.array([world.grid.width, world.grid.height], dtype=np.float64)
+        return world.cached('state', lambda: (world.pos / size).flatten())
+    def encode_grid_to_onehot(self, world, grid):
+        return self.encode_to_onehot(world, grid.encode()) # full encoded map
+    def encode_to_onehot(self, world, encoded):
+        # state representation plan: one-hot vector per grid cell
+        # id-th index marked when any kind of agent is there
+        # 0-th index marked when there is a wall
+        n = len(world.agents) # number of agents
+
+        encoded = encoded.reshape(-1, 3)
+        res = np.zeros((len(encoded), n + 1))
+        wall = encoded[:, 0] == OBJECT_TO_IDX['wall']
+        res[wall, 0] = 1.0
+        agent = ~wall & (encoded[:, 0] != 0)
+        res[np.flatnonzero(agent), encoded[agent, 2]] = 1.0
+
+        return res.flatten()
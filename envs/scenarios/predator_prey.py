@@ -1,29 +1,19 @@
 from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
-import itertools
 import numpy as np
-from envs.grid_core import World, CoreAgent
+from envs.grid_core import World, CoreAgent, type_windows, PLANE_TYPES
 from envs.scenario import BaseScenario
 import config
 
 FLAGS = config.flags.FLAGS
 IDX_TO_OBJECT = config.IDX_TO_OBJECT
+OBJECT_TO_IDX = config.OBJECT_TO_IDX
 
 
 class Prey(CoreAgent):
     def __init__(self):
         super(Prey, self).__init__('prey', 'green')
-        self._movement_mask = np.array(
-            [[0,1,0],
-             [1,0,1],
-             [0,1,0]], dtype=np.int8
-        )
-
-    def is_captured(self, world):
-        x, y = self.pos
-        minimap = world.grid.slice(x-1,y-1,3,3).encode()[:,:,0] != 0
-        return np.sum(minimap*self._movement_mask) == 4
 
 class Predator(CoreAgent):
     def __init__(self):
@@ -60,10 +50,10 @@ class Scenario(BaseScenario):
 
         # used by BaseScenario
         # assign id to agents
-        world.agents = agents
-        for i, agent in enumerate(world.agents):
+        for i, agent in enumerate(agents):
             agent.id = i + 1
             agent.silent = True
+        world.agents = agents
 
         # make initial conditions
         self.reset_world(world)
@@ -73,8 +63,7 @@ class Scenario(BaseScenario):
         world.empty_grid()
 
         # randomly place agents
-        for agent in world.agents:
-            world.placeObj(agent)
+        world.place_agents(world.agents)
         
         world.set_observations()
 
@@ -87,60 +76,28 @@ class Scenario(BaseScenario):
             else:
                 reward = -0.01
                 # determine whether the prey has been captured
-                for i in self.atype_to_idx['prey']:
-                    prey = world.agents[i]
-                    if prey.is_captured(world):
-                        self.prey_captured = True
-                        return 1
+                if self.captured(world).any():
+                    self.prey_captured = True
+                    return 1
                 return reward
         else: # if prey
-            if agent.is_captured(world):
+            if self.captured(world)[world.agent_index[agent.id]]:
                 return -1
         return 0
 
-    def encode_grid_to_onehot(self, world, grid):
-        encoded = grid.encode() # full encoded map
-        # state representation plan: one-hot vector per grid cell
-        # id-th index marked when any kind of agent is there
-        # 0-th index marked when there is a wall
-        n = len(world.agents) # number of agents
-
-        res = np.array([])
-        for cell in encoded.reshape(-1, 3):
-            cell_onehot = np.zeros(n + 1)
-            if IDX_TO_OBJECT[cell[0]] == 'wall':
-                cell_onehot[0] = 1.0
-            elif cell[0] != 0:
-                cell_onehot[cell[2]] = 1.0
-            res = np.concatenate((res, cell_onehot))
-
-        return res
-
     def observation(self, agent, world):
         # obs_native = np.array(agent.get_obs())
-        obs_native = self.encode_grid_to_onehot(world, agent.get_obs())
         # encode all predators and preys into same id
         # TODO: try not to distinguish the same kind of agents..
         indistinguish = True
         if indistinguish:
-            obs = np.array([])
-            for cell in obs_native.reshape(-1, len(world.agents) + 1):
-                # one-hot encoded cell w.r.t. agent id
-                compact_cell = np.zeros(3) # wall, predator, prey
-                if np.max(cell) != 0:
-                    idx = np.argmax(cell)
-                    if idx == 0: # wall
-                        compact_cell[0] = 1.0
-                    elif idx in [world.agents[i].id for i in self.atype_to_idx['predator']]:
-                        compact_cell[1] = 1.0
-                    elif idx in [world.agents[i].id for i in self.atype_to_idx['prey']]:
-                        compact_cell[2] = 1.0
-                    else:
-                        raise Exception('cell has to be wall/predator/prey!')
-                obs = np.concatenate([obs, compact_cell])
-            ret = obs
+            # wall, predator, prey planes, read from the object type of each cell
+            types = agent.get_obs()[:, :, 0]
+            if not np.isin(types, np.append(PLANE_TYPES, OBJECT_TO_IDX['empty'])).all():
+                raise Exception('cell has to be wall/predator/prey!')
+            ret = (types[..., None] == PLANE_TYPES).astype(np.float64).flatten()
         else:
-            ret = obs_native
+            ret = self.encode_to_onehot(world, agent.get_obs())
         if not FLAGS.obs_diagonal:
             blk = ret.reshape([-1, 3])
             ret = np.concatenate([[blk[1]], blk[3:6], [blk[7]]]).flatten()
@@ -149,21 +106,51 @@ class Scenario(BaseScenario):
         ret = np.concatenate([ret, [x / world.grid.width, y / world.grid.height]])
         return ret
 
+    def observation_batch(self, world, pos, memory):
+        """
+        observation() of the predators for a batch of worlds, each given by
+        the positions of all agents; predators keep no memory
+
+        :param pos: (B, n_agents, 2) positions, row k for the agent with id k+1
+        :return: (B, n_predator, obs_dim) observations, and memory unchanged
+        """
+
+        pos = np.asarray(pos)
+        predators = self.atype_to_idx['predator']
+        types = np.array([OBJECT_TO_IDX[agent.itype] for agent in world.agents])
+        obs_range = set(world.agents[k].obs_range for k in predators)
+        if len(obs_range) > 1:
+            raise ValueError("observation_batch needs the same obs_range for all predators")
+        windows = type_windows(world.grid.width, world.grid.height, types, pos, predators, obs_range.pop())
+        planes = (windows[..., None] == PLANE_TYPES).astype(np.float64)
+        planes = planes.reshape(planes.shape[:2] + (-1, 3))
+        if not FLAGS.obs_diagonal:
+            planes = planes[:, :, [1, 3, 4, 5, 7]]
+        pos_normal = pos[:, predators] / np.array([world.grid.width, world.grid.height], dtype=np.float64)
+        return np.concatenate([planes.reshape(planes.shape[:2] + (-1,)), pos_normal], axis=-1), memory
+
+    def observation_binary(self, world):
+        # wall/predator/prey planes, then the position
+        obs_range = set(world.agents[k].obs_range for k in self.atype_to_idx['predator'])
+        if len(obs_range) > 1:
+            return None
+        n_planes = 3 * (2 * obs_range.pop() + 1) ** 2 if FLAGS.obs_diagonal else 15
+        return np.arange(n_planes + 2) < n_planes
+
     def info(self, agent, world):
         # info() returns the global state
         coord_as_state = True
         if coord_as_state:
             # encode coordinates into state
-            width = world.grid.width
-            height = world.grid.height
-            encoded = world.grid.encode()[:, :, 2]
-            state = np.zeros((len(world.agents), 2)) # n_agents * (x,y)
-            for x, y in itertools.product(*map(range, (width, height))):
-                if encoded[y, x] != 0:
-                    state[encoded[y, x] - 1] = np.array([x/width, y/height])
-            return {'state': state.flatten()}
+            return {'state': self.coord_state(world)}
         else:
             return {'state': self.encode_grid_to_onehot(world, world.grid)}
 
     def done(self, agent, world):
-        return self.prey_captured
\ No newline at end of file
+        return self.prey_captured
+
+    def snapshot(self, world):
+        return self.prey_captured
+
+    def restore(self, world, state):
+        self.prey_captured = state
\ No newline at end of file
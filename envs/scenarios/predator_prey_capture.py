@@ -1,29 +1,19 @@
 from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
-import itertools
 import numpy as np
-from envs.grid_core import World, CoreAgent
+from envs.grid_core import World, CoreAgent, type_windows, window_features
 from envs.scenario import BaseScenario
 import config
 
 FLAGS = config.flags.FLAGS
 IDX_TO_OBJECT = config.IDX_TO_OBJECT
+OBJECT_TO_IDX = config.OBJECT_TO_IDX
 
 
 class Prey(CoreAgent):
     def __init__(self):
         super(Prey, self).__init__('prey', 'green')
-        self._movement_mask = np.array(
-            [[0,1,0],
-             [1,0,1],
-             [0,1,0]], dtype=np.int8
-        )
-
-    def is_captured(self, world):
-        x, y = self.pos
-        minimap = world.grid.slice(x-1,y-1,3,3).encode()[:,:,0] != 0
-        return np.sum(minimap*self._movement_mask) == 4
 
 
 class Predator(CoreAgent):
@@ -52,6 +42,13 @@ class Predator(CoreAgent):
 
         return ret
 
+    def get_memory(self):
+        return [float(self.obs_prey_before), self.last_obs_x, self.last_obs_y]
+
+    def set_memory(self, memory):
+        self.obs_prey_before = bool(memory[0])
+        self.last_obs_x, self.last_obs_y = memory[1:]
+
 
 class Scenario(BaseScenario):
     def __init__(self):
@@ -83,10 +80,10 @@ class Scenario(BaseScenario):
 
         # used by BaseScenario
         # assign id to agents
-        world.agents = agents
-        for i, agent in enumerate(world.agents):
+        for i, agent in enumerate(agents):
             agent.id = i + 1
             agent.silent = True
+        world.agents = agents
 
         # make initial conditions
         self.reset_world(world)
@@ -96,8 +93,8 @@ class Scenario(BaseScenario):
         world.empty_grid()
 
         # randomly place agents
+        world.place_agents(world.agents)
         for agent in world.agents:
-            world.placeObj(agent)
             if agent.itype == 'predator':
                 agent.reset_obs_prey()
 
@@ -112,35 +109,15 @@ class Scenario(BaseScenario):
             else:
                 reward = -0.01
                 # determine whether the prey has been captured
-                for i in self.atype_to_idx['prey']:
-                    prey = world.agents[i]
-                    if prey.is_captured(world):
-                        self.prey_captured = True
-                        return 1
+                if self.captured(world).any():
+                    self.prey_captured = True
+                    return 1
                 return reward
         else: # if prey
-            if agent.is_captured(world):
+            if self.captured(world)[world.agent_index[agent.id]]:
                 return -1
         return 0
 
-    def encode_grid_to_onehot(self, world, grid):
-        encoded = grid.encode() # full encoded map
-        # state representation plan: one-hot vector per grid cell
-        # id-th index marked when any kind of agent is there
-        # 0-th index marked when there is a wall
-        n = len(world.agents) # number of agents
-
-        res = np.array([])
-        for cell in encoded.reshape(-1, 3):
-            cell_onehot = np.zeros(n + 1)
-            if IDX_TO_OBJECT[cell[0]] == 'wall':
-                cell_onehot[0] = 1.0
-            elif cell[0] != 0:
-                cell_onehot[cell[2]] = 1.0
-            res = np.concatenate((res, cell_onehot))
-
-        return res
-
     def observation(self, agent, world):
 
         pos_normal = True
@@ -166,20 +143,8 @@ class Scenario(BaseScenario):
         return ret
 
     def obs_predator(self, agent, world):
-        obs_native = self.encode_grid_to_onehot(world, agent.get_obs())
-        obs = np.array([])
-        for cell in obs_native.reshape(-1, len(world.agents) + 1):
-            # one-hot encoded cell w.r.t. agent id
-            obs_pred = 0.0
-            if np.max(cell) != 0:
-                idx = np.argmax(cell)
-                if idx in [world.agents[i].id for i in self.atype_to_idx['predator']]:
-                    obs_pred = 1.0
-            obs = np.concatenate([obs, [obs_pred]])
-
-        return obs
-
-
+        planes = self.features(world)[0][world.agent_index[agent.id]]
+        return planes[:, :, 1].flatten().astype(np.float64)
 
     def get_pos_normal(self, agent, world):
         x, y = agent.pos  # TODO: order has problem
@@ -187,51 +152,88 @@ class Scenario(BaseScenario):
         return ret
 
     def check_prey(self, agent, world):
-
-        obs_native = self.encode_grid_to_onehot(world, agent.get_obs())
-
-        check_prey = 0.0
-        coor_prey = 0
-        cnt = 0
-        obs_prey = []
-        px = -1.0
-        py = -1.0
-
-        for cell in obs_native.reshape(-1, len(world.agents) + 1):
-            # one-hot encoded cell w.r.t. agent id
-            check = 0.0
-            if np.max(cell) != 0:
-                idx = np.argmax(cell)
-                if idx in [world.agents[i].id for i in self.atype_to_idx['prey']]:
-                    check_prey = 1.0
-                    check = 1.0
-                    coor_prey = cnt
-            obs_prey.append(check)
-            cnt += 1
-
-        if check_prey == 1.0:
-            obs_size = (2*agent.obs_range + 1)
-            px = (coor_prey // obs_size) / (obs_size - 1)
-            py = (coor_prey % obs_size) / (obs_size - 1)
-
-        return check_prey, px, py
-
+        return tuple(self.features(world)[1][world.agent_index[agent.id]])
+
+    def features(self, world):
+        # extract_features() of all agents, computed once per step
+        return world.cached('features', lambda: self.extract_features(world, world.agents))
+
+    def extract_features(self, world, agents):
+        """
+        Features of the windows observed by agents, for all of them at once
+
+        Cells are classified by the object type of the grid encoding, which
+        set() fills from the entity type, so no per-cell id lookups are
+        needed. The prey position is the last prey cell in row-major order.
+
+        :return: list with a (2r+1, 2r+1, 3) wall/predator/prey plane array
+                 per agent, and (len(agents), 3) array of the prey-seen flag
+                 and the prey coordinates (px, py), -1 when no prey is seen
+        """
+
+        planes = [None] * len(agents)
+        prey = np.zeros((len(agents), 3))
+        for r in set(agent.obs_range for agent in agents):
+            group = [k for k, agent in enumerate(agents) if agent.obs_range == r]
+            types = np.stack([agents[k].get_obs()[:, :, 0] for k in group])
+            group_planes, prey[group] = window_features(types)
+            for k, plane in zip(group, group_planes):
+                planes[k] = plane
+
+        return planes, prey
+
+    def observation_batch(self, world, pos, memory):
+        """
+        observation() of the predators for a batch of worlds, each given by
+        the positions of all agents and the memories of the predators
+
+        :param pos: (B, n_agents, 2) positions, row k for the agent with id k+1
+        :param memory: (B, n_predator, 3) get_memory() of the predators
+        :return: (B, n_predator, obs_dim) observations, and the memories
+                 after observing
+        """
+
+        pos = np.asarray(pos)
+        predators = self.atype_to_idx['predator']
+        types = np.array([OBJECT_TO_IDX[agent.itype] for agent in world.agents])
+        obs_range = set(world.agents[k].obs_range for k in predators)
+        if len(obs_range) > 1:
+            raise ValueError("observation_batch needs the same obs_range for all predators")
+        windows = type_windows(world.grid.width, world.grid.height, types, pos, predators, obs_range.pop())
+        planes, prey = window_features(windows)
+
+        # set_obs_prey() of the predators that see the prey
+        seen = prey[..., :1] == 1
+        memory = np.where(seen, np.concatenate([np.ones_like(seen), prey[..., 1:]], axis=-1), memory)
+        pos_normal = pos[:, predators] / np.array([world.grid.width - 1, world.grid.height - 1], dtype=np.float64)
+        obs_predator = planes[..., 1].reshape(planes.shape[:2] + (-1,))
+        return np.concatenate([pos_normal, prey[..., :1], memory, obs_predator], axis=-1), memory
+
+    def observation_memory(self, obs):
+        return np.asarray(obs)[..., 3:6]
+
+    def observation_binary(self, world):
+        # position, prey-seen flag, the memory of the prey, then the predator plane
+        obs_range = set(world.agents[k].obs_range for k in self.atype_to_idx['predator'])
+        if len(obs_range) > 1:
+            return None
+        return np.concatenate([[False, False, True, True, False, False],
+                               np.ones((2 * obs_range.pop() + 1) ** 2, dtype=bool)])
 
     def info(self, agent, world):
         # info() returns the global state
         coord_as_state = True
         if coord_as_state:
             # encode coordinates into state
-            width = world.grid.width
-            height = world.grid.height
-            encoded = world.grid.encode()[:, :, 2]
-            state = np.zeros((len(world.agents), 2)) # n_agents * (x,y)
-            for x, y in itertools.product(*map(range, (width, height))):
-                if encoded[y, x] != 0:
-                    state[encoded[y, x] - 1] = np.array([x/width, y/height])
-            return {'state': state.flatten()}
+            return {'state': self.coord_state(world)}
         else:
             return {'state': self.encode_grid_to_onehot(world, world.grid)}
 
     def done(self, agent, world):
-        return self.prey_captured
\ No newline at end of file
+        return self.prey_captured
+
+    def snapshot(self, world):
+        return self.prey_captured
+
+    def restore(self, world, state):
+        self.prey_captured = state
\ No newline at end of file
@@ -0,0 +1,214 @@
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+import ctypes
+import multiprocessing
+import traceback
+import numpy as np
+import config
+
+
+def _shared(ctx, ctype, shape):
+    # zeroed shared memory, to be wrapped with _as_array() in each process
+    return ctx.RawArray(ctype, int(np.prod(shape))), shape
+
+
+def _as_array(buf, dtype):
+    raw, shape = buf
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def _worker(remote, parent_remote, k, scenario_name, seed, buffers, flag_values):
+    parent_remote.close()
+    try:
+        _run_worker(remote, k, scenario_name, seed, buffers, flag_values)
+    except Exception:
+        # the parent raises the error on its next reply
+        remote.send(traceback.format_exc())
+    remote.close()
+
+
+def _run_worker(remote, k, scenario_name, seed, buffers, flag_values):
+    config.set_flag_values(flag_values)
+    import make_env
+
+    env = make_env.make_env(scenario_name, array_mode=True)
+    env.seed(seed)
+
+    action = _as_array(buffers['action'], np.int32)[k]
+    obs = _as_array(buffers['obs'], np.float32)[k]
+    reward = _as_array(buffers['reward'], np.float32)[k]
+    done = _as_array(buffers['done'], np.bool_)[k]
+    state = _as_array(buffers['state'], np.float32)[k]
+    terminal_obs = _as_array(buffers['terminal_obs'], np.float32)[k]
+    terminal_state = _as_array(buffers['terminal_state'], np.float32)[k]
+
+    def reset():
+        obs[:] = env.reset()
+        state[:] = env.get_info()[0]['state']
+
+    while True:
+        cmd = remote.recv()
+        if cmd == 'step':
+            o, r, d, info = env.step(action)
+            reward[:] = r
+            done[:] = d
+            if d.any():
+                # keep the last observation of the episode and start the next
+                terminal_obs[:] = o
+                terminal_state[:] = info['state']
+                reset()
+            else:
+                obs[:] = o
+                state[:] = info['state']
+        elif cmd == 'reset':
+            reset()
+            done[:] = False
+        elif cmd == 'close':
+            break
+        else:
+            raise NotImplementedError(cmd)
+        remote.send(True)
+
+
+def _check_reply(remote):
+    try:
+        reply = remote.recv()
+    except EOFError:
+        raise RuntimeError("An env worker process exited unexpectedly")
+    if reply is not True:
+        raise RuntimeError("An env worker process failed:\n" + reply)
+
+
+class SubprocVecMultiAgentEnv(object):
+    """
+    Run n_envs copies of a scenario in worker processes, stepped in lockstep
+
+    Actions, observations, rewards, dones and global states go through
+    shared memory arrays; only short commands go through pipes. Envs are
+    created with make_env(scenario_name, array_mode=True), so observations
+    are zero padded to the largest obs_dim.
+
+    An env whose episode is done is reset within the same step: obs and
+    state then hold the first observation of the new episode, while
+    terminal_obs and terminal_state hold the last one of the finished
+    episode. The returned arrays are overwritten by the next step.
+
+    Workers are started with the spawn method, since the parent may already
+    run a TF session. An exception in a worker is raised in the parent, with
+    the traceback of the worker, at the next reply it waits for.
+    """
+
+    def __init__(self, scenario_name, n_envs, seed=None):
+        import make_env
+
+        self.n_envs = n_envs
+        self.closed = False
+
+        # local copy for the spaces and the agent profile
+        env = make_env.make_env(scenario_name, array_mode=True)
+        self._env = env
+        self.n = env.n
+        self.observation_space = env.observation_space
+        self.action_space = env.action_space
+        self.obs_dim = env.obs_dim
+
+        ctx = multiprocessing.get_context('spawn')
+        obs_shape = (n_envs, env.n, max(env.obs_dim))
+        state_shape = (n_envs, len(env.get_info()[0]['state']))
+        buffers = {
+            'action': _shared(ctx, ctypes.c_int32, (n_envs, env.n)),
+            'obs': _shared(ctx, ctypes.c_float, obs_shape),
+            'reward': _shared(ctx, ctypes.c_float, (n_envs, env.n)),
+            'done': _shared(ctx, ctypes.c_bool, (n_envs, env.n)),
+            'state': _shared(ctx, ctypes.c_float, state_shape),
+            'terminal_obs': _shared(ctx, ctypes.c_float, obs_shape),
+            'terminal_state': _shared(ctx, ctypes.c_float, state_shape),
+        }
+        self._action = _as_array(buffers['action'], np.int32)
+        self.obs = _as_array(buffers['obs'], np.float32)
+        self.reward = _as_array(buffers['reward'], np.float32)
+        self.done = _as_array(buffers['done'], np.bool_)
+        self.state = _as_array(buffers['state'], np.float32)
+        self.terminal_obs = _as_array(buffers['terminal_obs'], np.float32)
+        self.terminal_state = _as_array(buffers['terminal_state'], np.float32)
+
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+
+        self.remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for k, (work_remote, remote, env_seed) in enumerate(zip(work_remotes, self.remotes, seed.spawn(n_envs))):
+            process = ctx.Process(target=_worker,
+                                  args=(work_remote, remote, k, scenario_name, env_seed, buffers, config.flag_values()))
+            process.daemon = True  # if the main process crashes, we should not cause things to hang
+            process.start()
+            self.processes.append(process)
+        for work_remote in work_remotes:
+            work_remote.close()
+
+    def get_agent_profile(self):
+        return self._env.get_agent_profile()
+
+    def _wait(self):
+        for remote in self.remotes:
+            _check_reply(remote)
+
+    def reset(self):
+        """
+        :return: (n_envs, n_agents, obs_dim) observations and
+                 (n_envs, state_dim) global states
+        """
+
+        for remote in self.remotes:
+            remote.send('reset')
+        self._wait()
+        return self.obs, self.state
+
+    def step_async(self, actions):
+        self._action[:] = actions
+        for remote in self.remotes:
+            remote.send('step')
+
+    def step_wait(self):
+        """
+        :return: observations, (n_envs, n_agents) rewards and dones, and
+                 global states
+        """
+
+        self._wait()
+        return self.obs, self.reward, self.done, self.state
+
+    def step(self, actions):
+        """
+        :param actions: (n_envs, n_agents) array of action ids
+        """
+
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_env_async(self, k, action):
+        """
+        Start a step of env k alone; wait for it with step_env_wait(k)
+
+        :param action: (n_agents,) array of action ids
+        """
+
+        self._action[k] = action
+        self.remotes[k].send('step')
+
+    def step_env_wait(self, k):
+        _check_reply(self.remotes[k])
+        return self.obs[k], self.reward[k], self.done[k], self.state[k]
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            try:
+                remote.send('close')
+            except (IOError, OSError):
+                pass  # the worker already failed
+        for process in self.processes:
+            process.join()
+        self.closed = True
@@ -15,25 +15,32 @@ import numpy as np
 FLAGS = config.flags.FLAGS
 
 def set_seed(seed):
+    """
+    Seed the global generators and return the root seed sequence from which
+    the env and the trainer spawn their own random streams
+    """
 
     random.seed(seed)
     np.random.seed(seed)
     tf.set_random_seed(seed)
-    return None
+    return np.random.SeedSequence(seed)
 
 
 if __name__ == '__main__':
 
-    set_seed(1)
+    env_seed, trainer_seed = set_seed(FLAGS.seed).spawn(2)
 
     logger_env = logging.getLogger('GridMARL')
     logger_agent = logging.getLogger('Agent')
 
     env = make_env.make_env(FLAGS.scenario)
+    env.seed(env_seed)
     logger_env.info('GridMARL Start with %d predator(s) and %d prey(s)', FLAGS.n_predator, FLAGS.n_prey)
 
     logger_agent.info('Agent: {}'.format(FLAGS.agent))
-    trainer = agents.load(FLAGS.agent+"/trainer.py").Trainer(env)
+    # test_parallel() only spreads the seeds over workers, so its trainer needs no critic or replay memory
+    trainer = agents.load(FLAGS.agent+"/trainer.py").Trainer(env, seed=trainer_seed,
+                                                             learner=FLAGS.train or FLAGS.eval_seeds == 0)
 
     print(FLAGS.agent, config.file_name)
 
@@ -43,6 +50,8 @@ if __name__ == '__main__':
         finish_time = time.time()
         trainer.test()
         print("TRAINING TIME (sec)", finish_time - start_time)
+    elif FLAGS.eval_seeds > 0:
+        trainer.test_parallel(FLAGS.eval_seeds)
     else:
         trainer.test()
 
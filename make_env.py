@@ -12,7 +12,7 @@ of size (env.world.dim_p + env.world.dim_c, 1). Physical actions precede
 communication actions in this array. See environment.py for more details.
 """
 
-def make_env(scenario_name):
+def make_env(scenario_name, array_mode=False):
     '''
     Creates a MultiAgentEnv object as env. This can be used similar to a gym
     environment by calling env.reset() and env.step().
@@ -26,6 +26,9 @@ def make_env(scenario_name):
         .observation_space  :   Returns the observation space for each agent
         .action_space       :   Returns the action space for each agent
         .n                  :   Returns the number of Agents
+
+    With array_mode, step() and reset() return stacked float32 arrays
+    written into buffers that are reused between calls.
     '''
     from envs.environment import MultiAgentEnv
     import envs.scenarios as scenarios
@@ -39,5 +42,11 @@ def make_env(scenario_name):
                                 reward_callback=scenario.reward, 
                                 observation_callback=scenario.observation,
                                 info_callback=scenario.info,
-                                done_callback=scenario.done,)
+                                done_callback=scenario.done,
+                                snapshot_callback=scenario.snapshot,
+                                restore_callback=scenario.restore,
+                                observation_batch_callback=scenario.observation_batch,
+                                observation_memory_callback=scenario.observation_memory,
+                                observation_binary_callback=scenario.observation_binary,
+                                array_mode=array_mode)
     return env